@@ -0,0 +1,162 @@
+"""Actors: nebula functions running in their own process, talking to whoever spawned them over a channel."""
+import sys, io, pickle, multiprocessing
+sys.dont_write_bytecode = True
+from array import array
+from collections import deque
+from multiprocessing import shared_memory, resource_tracker
+from output import OUTPUT
+from diskdict import sync_all
+
+# Lists of plain ints or floats at least this long go through shared memory instead of the pipe
+SHARED_THRESHOLD = 10000
+
+class SharingPickler(pickle.Pickler):
+    """Pickles a message, moving big lists of numbers into shared memory blocks the receiver picks up."""
+    def __init__(self, file, protocol=None):
+        super().__init__(file, protocol=protocol)
+        # Names of the blocks made for this message, unlinked again if it never gets sent
+        self.blocks = []
+
+    def persistent_id(self, obj):
+        if type(obj) is not list or len(obj) < SHARED_THRESHOLD:
+            return None
+        kind = type(obj[0])
+        typecode = {int: 'q', float: 'd'}.get(kind)
+        if typecode is None or not all(type(x) is kind for x in obj):
+            return None
+        try:
+            data = array(typecode, obj)
+        except OverflowError:
+            return None
+        size = len(data) * data.itemsize
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        shm.buf[:size] = memoryview(data).cast('B')
+        shm.close()
+        self.blocks.append(shm.name)
+        # The receiver unlinks it once it has been read. Until then it stays registered with the resource
+        # tracker every actor shares with its parent (see Actor), which unlinks any nobody picked up when they've all exited
+        return ('shm', shm.name, typecode, len(data))
+
+class SharingUnpickler(pickle.Unpickler):
+    def persistent_load(self, pid):
+        _, name, typecode, length = pid
+        shm = shared_memory.SharedMemory(name=name)
+        data = array(typecode)
+        data.frombytes(shm.buf[:length * data.itemsize])
+        shm.close()
+        shm.unlink()
+        return data.tolist()
+
+class Channel:
+    """One end of a pipe that carries nebula values."""
+    def __init__(self, conn):
+        self.conn = conn
+
+    def send(self, value):
+        """Sends value, giving back the names of the shared memory blocks that went with it."""
+        buf = io.BytesIO()
+        pickler = SharingPickler(buf, protocol=pickle.HIGHEST_PROTOCOL)
+        try:
+            pickler.dump(value)
+            self.conn.send_bytes(buf.getbuffer())
+        except BaseException:
+            unlink(pickler.blocks)
+            raise
+        return pickler.blocks
+
+    def recv(self):
+        return SharingUnpickler(io.BytesIO(self.conn.recv_bytes())).load()
+
+    def poll(self, timeout=0):
+        return self.conn.poll(timeout)
+
+def unlink(names):
+    for name in names:
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            # Already picked up
+            continue
+        shm.close()
+        shm.unlink()
+
+class Mailbox(Channel):
+    """The actor's own end: everything it sends is tagged so the parent can tell messages from the final result."""
+    def send(self, value):
+        super().send(('msg', value))
+
+class Actor:
+    """The parent's handle on a spawned function."""
+    def __init__(self, fn, args, interpreter):
+        if not hasattr(fn, 'body'):
+            raise TypeError("spawn expects a nebula function")
+        ctx = multiprocessing.get_context('fork')
+        # Started before forking so the child uses ours. One of its own would unlink the blocks it sent us as soon as it exited
+        resource_tracker.ensure_running()
+        parent, child = ctx.Pipe()
+        self.channel = Channel(parent)
+        self.inbox = deque()
+        # Blocks sent that the actor may not have picked up yet, unlinked once it's finished
+        self.shared = []
+        self.finished = False
+        self.result = self.error = None
+        # The forked child gets its own copy of the interpreter and everything the function can see
+        self.process = ctx.Process(target=run_actor, args=(fn, list(args), interpreter, child), daemon=True)
+        self.process.start()
+        child.close()
+
+    def send(self, value):
+        if self.finished:
+            raise RuntimeError("actor has finished, it can't receive anything")
+        self.shared.extend(self.channel.send(value))
+
+    def recv(self):
+        while not self.inbox:
+            if self.finished:
+                raise RuntimeError("actor has finished, there is nothing left to receive")
+            self.read()
+        return self.inbox.popleft()
+
+    def poll(self, timeout=0):
+        while not self.inbox and not self.finished and self.channel.poll(timeout):
+            self.read()
+        return bool(self.inbox)
+
+    def join(self):
+        """Waits for the function to return and gives back its result, keeping any messages it sent for recv."""
+        while not self.finished:
+            self.read()
+        self.process.join()
+        if self.error:
+            raise RuntimeError(self.error)
+        return self.result
+
+    def read(self):
+        try:
+            tag, value = self.channel.recv()
+        except EOFError:
+            tag, value = 'error', f"actor exited without finishing (exit code {self.process.exitcode})"
+        if tag == 'msg':
+            self.inbox.append(value)
+            return
+        self.finished = True
+        unlink(self.shared)
+        self.shared = []
+        if tag == 'done':
+            self.result = value
+        else:
+            self.error = value
+
+def run_actor(fn, args, interpreter, conn):
+    mailbox = Mailbox(conn)
+    try:
+        result = fn([{'__type__': '__channel__', '__channel__': mailbox}] + args, interpreter)
+        # The child leaves through os._exit, which wouldn't write out what the actor printed or put in a diskdict
+        OUTPUT.flush()
+        sync_all()
+        # Skip the ('msg', ...) tagging Mailbox.send does
+        Channel.send(mailbox, ('done', result))
+    except Exception as e:
+        OUTPUT.flush()
+        sync_all()
+        Channel.send(mailbox, ('error', f"{type(e).__name__}: {e}"))
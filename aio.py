@@ -0,0 +1,125 @@
+"""asyncio support: nebula coroutines, the non-blocking builtins and the event loop they run on."""
+import sys, os, asyncio, threading
+sys.dont_write_bytecode = True
+from views import LISTS
+
+class EventLoop:
+    """An asyncio loop running in a background thread.
+
+    The interpreter itself stays synchronous. Every running nebula coroutine gets a thread of its own,
+    but only the thread holding the baton runs nebula code, and it only hands the baton over while it
+    awaits something. So coroutines take turns at await points, and the waiting happens on asyncio.
+    """
+    def __init__(self):
+        self.pid = os.getpid()
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        # Whoever starts the loop is running nebula code right now
+        self.baton = threading.Lock()
+        self.baton.acquire()
+
+    def wait(self, value):
+        """What `await value` does: anything that isn't awaitable is just given back."""
+        if not isinstance(value, Awaitable):
+            return value
+        future = value.start(self)
+        self.baton.release()
+        try:
+            return future.result()
+        finally:
+            self.baton.acquire()
+
+class Awaitable:
+    """Something nebula code can await. Nothing happens until it's awaited or gathered."""
+    future = None
+
+    def start(self, loop):
+        # Starting twice gives back the same future, so awaiting twice gives the same result
+        if self.future is None:
+            self.future = asyncio.run_coroutine_threadsafe(self.run(loop), loop.loop)
+        return self.future
+
+    async def run(self, loop):
+        raise NotImplementedError
+
+class Coroutine(Awaitable):
+    """What calling an `async def` function gives back."""
+    def __init__(self, fn, args, interpreter):
+        self.fn = fn
+        self.args = args
+        self.interpreter = interpreter
+
+    def __repr__(self):
+        return '<coroutine>'
+
+    async def run(self, loop):
+        done = loop.loop.create_future()
+        def finish(setter, value):
+            if not done.done():
+                setter(value)
+        def body():
+            with loop.baton:
+                try:
+                    result = self.fn.run(self.args, self.interpreter)
+                except BaseException as e:
+                    loop.loop.call_soon_threadsafe(finish, done.set_exception, e)
+                    return
+            loop.loop.call_soon_threadsafe(finish, done.set_result, result)
+        threading.Thread(target=body, daemon=True).start()
+        return await done
+
+class Pending(Awaitable):
+    """A builtin operation waiting to be started on the loop."""
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+
+    def __repr__(self):
+        return f'<pending {self.name}>'
+
+    async def run(self, loop):
+        return await self.factory(loop)
+
+def as_future(value, loop):
+    if isinstance(value, Awaitable):
+        return asyncio.wrap_future(value.start(loop))
+    finished = loop.loop.create_future()
+    finished.set_result(value)
+    return finished
+
+def read_file(path):
+    with open(path, 'r') as f:
+        return f.read()
+
+def write_file(path, data):
+    with open(path, 'w') as f:
+        return f.write(data)
+
+# The builtins, they all take (args, interpreter) and give back something to await
+
+def aread(args, _):
+    path = args[0]
+    return Pending('aread', lambda loop: loop.loop.run_in_executor(None, read_file, path))
+
+def awrite(args, _):
+    path, data = args
+    return Pending('awrite', lambda loop: loop.loop.run_in_executor(None, write_file, path, data))
+
+def arun(args, _):
+    command = args[0]
+    async def run(loop):
+        proc = await asyncio.create_subprocess_shell(command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        stdout, stderr = await proc.communicate()
+        return {'code': proc.returncode, 'stdout': stdout.decode(), 'stderr': stderr.decode()}
+    return Pending('arun', run)
+
+def sleep(args, _):
+    # sleep(seconds, value) works as a timer that gives back value once it goes off
+    seconds, value = args[0], args[1] if len(args) > 1 else None
+    return Pending('sleep', lambda loop: asyncio.sleep(seconds, value))
+
+def gather(args, _):
+    items = args[0] if len(args) == 1 and isinstance(args[0], LISTS) else list(args)
+    async def run(loop):
+        return list(await asyncio.gather(*[as_future(item, loop) for item in items]))
+    return Pending('gather', run)
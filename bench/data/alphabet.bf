@@ -0,0 +1,10 @@
+Prints the alphabet thirty times
+++++++++++++++++++++++++++++++
+[
+ >++++++++[>++++++++<-]>+
+ <++++++++++++++++++++++++++
+ [>.+<-]
+ >[-]
+ ++++++++++.[-]
+ <<-
+]
@@ -0,0 +1,121 @@
+"""
+benchmarks for the nebula interpreter
+
+Every workload runs in this process with a fresh Interpreter: a few warmup runs first, then
+the timed ones. Results can be saved as JSON and compared against an earlier run to catch regressions.
+
+    python3 bench/run.py --save baseline.json
+    python3 bench/run.py --compare baseline.json
+"""
+import sys, os, io, json, math, time, argparse, statistics, contextlib
+sys.dont_write_bytecode = True
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import main as nebula
+
+# name: (script, arguments the script sees after its own name in __argv)
+WORKLOADS = {
+    'fib': ('bench/fib.fn', []),
+    'primes': ('bench/primes.fn', []),
+    'bf': ('examples/bf.fn', ['bench/data/alphabet.bf']),
+    'assemble': ('bench/assemble.fn', ['bench/data/program.stk']),
+    'oop': ('bench/oop.fn', []),
+    'strings': ('bench/strings.fn', []),
+    'array': ('bench/array.fn', []),
+    'output': ('bench/output.fn', []),
+    'search': ('bench/search.fn', []),
+    'strbuf': ('bench/strbuf.fn', []),
+    'regex': ('bench/regex.fn', []),
+    'records': ('bench/records.fn', []),
+    'diskdict': ('bench/diskdict.fn', []),
+    'table': ('bench/table.fn', []),
+    'slices': ('bench/slices.fn', []),
+    'startup': ('bench/startup.fn', []),
+    'micro/call': ('bench/micro/call.fn', []),
+    'micro/binop': ('bench/micro/binop.fn', []),
+    'micro/getattr': ('bench/micro/getattr.fn', []),
+    'micro/for': ('bench/micro/for.fn', []),
+    'micro/listcomp': ('bench/micro/listcomp.fn', []),
+    'micro/ffi': ('bench/micro/ffi.fn', []),
+    'micro/typed': ('bench/micro/typed.fn', []),
+}
+
+def run_once(script, args):
+    """Runs a script start to finish (reading, tokenizing, parsing, executing) and returns how long it took."""
+    sys.argv = ['main.py', script] + args
+    start = time.perf_counter()
+    with open(script, 'r') as f:
+        code = f.read()
+    with contextlib.redirect_stdout(io.StringIO()):
+        nebula.Interpreter().run(code, script)
+    return time.perf_counter() - start
+
+def percentile(times, pct):
+    ordered = sorted(times)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+def bench(name, warmup, repeat):
+    script, args = WORKLOADS[name]
+    for _ in range(warmup):
+        run_once(script, args)
+    times = [run_once(script, args) for _ in range(repeat)]
+    return {
+        'median': statistics.median(times),
+        'p95': percentile(times, 95),
+        'min': min(times),
+        'runs': times,
+    }
+
+def compare(results, baseline, threshold):
+    """Prints how each workload moved against the baseline and returns the names that got slower than the threshold."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]['median'], result['median']
+        change = (after - before) / before * 100
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        elif change < -threshold:
+            flag = '  faster'
+        print(f"{name:<16} {before * 1000:9.1f}ms -> {after * 1000:9.1f}ms {change:+7.1f}%{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the nebula interpreter.")
+    parser.add_argument('names', nargs='*', help="workloads to run, all of them by default (a prefix like micro/ works too)")
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', metavar='FILE', help="write the results to FILE as JSON")
+    parser.add_argument('--compare', metavar='FILE', help="compare against results saved with --save")
+    parser.add_argument('--threshold', type=float, default=10, help="percent slowdown that counts as a regression")
+    opts = parser.parse_args()
+
+    os.chdir(ROOT)
+    sys.setrecursionlimit(10000)
+    names = [n for n in WORKLOADS if not opts.names or any(n == p or n.startswith(p) for p in opts.names)]
+
+    results = {}
+    print(f"{'workload':<16} {'median':>10} {'p95':>10} {'min':>10}")
+    for name in names:
+        results[name] = bench(name, opts.warmup, opts.repeat)
+        r = results[name]
+        print(f"{name:<16} {r['median'] * 1000:8.1f}ms {r['p95'] * 1000:8.1f}ms {r['min'] * 1000:8.1f}ms")
+
+    if opts.save:
+        with open(opts.save, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'nebula': nebula.VERSION, 'workloads': results}, f, indent=2)
+
+    if opts.compare:
+        with open(opts.compare, 'r') as f:
+            baseline = json.load(f)['workloads']
+        print()
+        regressions = compare(results, baseline, opts.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+the thin client for the nebula serve daemon
+
+    python3 main.py --serve &              start the daemon
+    python3 client.py script.fn [args]     run a script the same way `python3 main.py script.fn [args]` does
+
+The client hands its own stdin, stdout and stderr over the socket, so the script reads and writes
+them directly, then exits with the script's exit status. Without a daemon it just runs main.py.
+"""
+import sys, os, marshal, signal, socket
+sys.dont_write_bytecode = True
+
+# The socket lives in a directory only its user can get into, anyone who could listen there would get our environment and terminal
+RUNTIME = os.environ.get('XDG_RUNTIME_DIR') or f'/tmp/nebula-{os.getuid()}'
+SOCKET = os.environ.get('NEBULA_SOCKET', os.path.join(RUNTIME, 'nebula.sock'))
+
+class Untrusted(ConnectionError):
+    """The socket, or the directory it's in, could belong to someone else."""
+
+def private(directory):
+    """Raises Untrusted unless directory is a real directory of ours that nobody else can get into."""
+    st = os.lstat(directory)
+    if not os.path.isdir(directory) or os.path.islink(directory) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise Untrusted(f"{directory} has to be a directory only you can use (mode 700)")
+
+def peer(conn):
+    """Raises Untrusted unless the process on the other end of conn runs as us."""
+    if not hasattr(socket, 'SO_PEERCRED'):
+        # No way to ask on this platform, the private directory has to do
+        return
+    # struct ucred: pid, uid, gid as native ints
+    creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, 12)
+    if int.from_bytes(creds[4:8], sys.byteorder) != os.getuid():
+        raise Untrusted("the daemon on the other end of the socket isn't running as you")
+
+def request(argv, path=SOCKET):
+    """Runs argv (as main.py would see it) in the daemon and returns the exit status."""
+    private(os.path.dirname(os.path.abspath(path)))
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.connect(path)
+    peer(conn)
+    # marshal because it's built in, importing json would take longer than the rest of the client
+    header = marshal.dumps({'argv': argv, 'cwd': os.getcwd(), 'env': dict(os.environ)})
+    socket.send_fds(conn, [len(header).to_bytes(4, 'little') + header], [0, 1, 2])
+    pid = read_int(conn)
+    try:
+        status = read_int(conn)
+    except KeyboardInterrupt:
+        # Ctrl-C is meant for the script, not for us
+        os.kill(pid, signal.SIGINT)
+        status = read_int(conn)
+    return 1 if status is None else status
+
+def read_int(conn):
+    """The daemon answers with 8 byte signed ints: the pid running the script, then its exit status."""
+    data = b''
+    while len(data) < 8:
+        chunk = conn.recv(8 - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return int.from_bytes(data, 'little', signed=True)
+
+def main():
+    argv = ['main.py'] + sys.argv[1:]
+    try:
+        status = request(argv)
+    except (FileNotFoundError, ConnectionRefusedError, Untrusted) as e:
+        # No daemon running (or none we'd trust), do what main.py would have done
+        if isinstance(e, Untrusted):
+            print(f"client.py: not using the daemon, {e}", file=sys.stderr)
+        here = os.path.dirname(os.path.abspath(__file__))
+        os.execv(sys.executable, [sys.executable, os.path.join(here, 'main.py')] + sys.argv[1:])
+    sys.exit(status)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""set, deque, heap and counter: the collections nebula has besides list and dict.
+
+They're the Python types themselves (a heap is a list kept in heap order), so `in`, length(),
+indexing and printing all work the way Python does them, and membership in a set or a counter
+doesn't scan.
+"""
+import sys, heapq
+sys.dont_write_bytecode = True
+import collections
+from collections import deque
+
+class Heap:
+    """A min heap: pop always gives back the smallest item. Push [priority, value] lists for a priority queue."""
+    __slots__ = ('items',)
+
+    def __init__(self, items=()):
+        self.items = list(items)
+        heapq.heapify(self.items)
+
+    def push(self, item):
+        heapq.heappush(self.items, item)
+
+    def pop(self):
+        if not self.items:
+            raise IndexError("pop from an empty heap")
+        return heapq.heappop(self.items)
+
+    def peek(self):
+        if not self.items:
+            raise IndexError("peek at an empty heap")
+        return self.items[0]
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return item in self.items
+
+    def __iter__(self):
+        # Smallest first, which is what anyone looping over a heap wants
+        return iter(sorted(self.items))
+
+    def __eq__(self, other):
+        return isinstance(other, Heap) and sorted(self.items) == sorted(other.items)
+
+    def __repr__(self):
+        return f"heap({sorted(self.items)})"
+
+class Counter(collections.Counter):
+    # Its own type so a Counter a Python module gives back keeps Python's methods (most_common's tuples and all)
+    __slots__ = ()
+
+# Types `for` and comprehensions turn into a list before going over them
+COLLECTIONS = (set, deque, Heap, Counter)
+
+def constructor(kind):
+    """The builtin that makes a kind of collection, out of a list (or anything else that can be looped over) or empty."""
+    def make(args, _):
+        return kind(args[0]) if args else kind()
+    return make
+
+def most_common(counter, n=None):
+    # Pairs as lists, nebula has no tuples
+    return [[item, count] for item, count in counter.most_common(n)]
+
+def counter_add(counter, item, count=1):
+    # Counting up doesn't need the item to be there already
+    counter[item] += count
@@ -0,0 +1,213 @@
+"""diskdict: a dictionary that lives in a SQLite file, for lookup tables too big to fit in memory.
+
+The keys used most recently are kept in memory along with their values, and changes are only
+written out when a key falls out of that cache, in batches of BATCH to a transaction. Values are
+written with marshal (plain data: numbers, strings, lists, dicts) and pickle for everything else.
+Keys are strings or numbers, stored as SQLite's own. A float with nothing after the point is
+stored as the int it equals, so 1 and 1.0 are one key (like in a dict) that always comes back as 1.
+"""
+import sys, sqlite3, marshal, pickle, atexit, weakref
+sys.dont_write_bytecode = True
+from collections import OrderedDict
+
+# Keys (and their values) kept in memory per diskdict, unless it's made with a size of its own
+CACHE = 10000
+# Changed keys written to the file per transaction
+BATCH = 1000
+# Keys fetched at a time while looping over a diskdict
+PAGE = 512
+
+# Values that can't change without being set again, so reading one never makes it need writing back
+IMMUTABLE = (str, int, float, bool, type(None), bytes)
+
+# Every diskdict still open, so what's in their caches gets written out when the script ends
+_open = weakref.WeakSet()
+
+def encode(value):
+    try:
+        return b'm' + marshal.dumps(value)
+    except ValueError:
+        # Instances, functions and the other collections marshal doesn't know about
+        return b'p' + pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+def decode(blob):
+    return marshal.loads(blob[1:]) if blob[:1] == b'm' else pickle.loads(blob[1:])
+
+def check_key(key):
+    """The key as it's stored, or raises TypeError if it can't be one."""
+    if not isinstance(key, (str, int, float)):
+        raise TypeError(f"diskdict keys have to be strings or numbers, not {type(key).__name__}")
+    # Otherwise whichever of 1 and 1.0 was set last would decide which one the file keeps
+    if type(key) is float and key.is_integer():
+        return int(key)
+    return key
+
+class DiskDict:
+    """A dict in a SQLite file, with the hot keys cached in memory and changes written back in batches."""
+
+    def __init__(self, path, size=CACHE, interpreter=None):
+        self.path = path
+        self.size = size
+        self.interpreter = interpreter
+        # Scheduled scripts run on threads of their own and the exit hook runs on the main one
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        # No column type, so SQLite keeps each key as the integer, real or text it came as
+        self.db.execute("CREATE TABLE IF NOT EXISTS items (key PRIMARY KEY, value BLOB NOT NULL) WITHOUT ROWID")
+        # key: value, least recently used first
+        self.cache = OrderedDict()
+        # Cached keys whose value might not be what the file has
+        self.dirty = set()
+        # key: encoded value, evicted from the cache and waiting for the next batch
+        self.pending = {}
+        _open.add(self)
+
+    def note(self, hit):
+        if self.interpreter is not None and self.interpreter.stats is not None:
+            self.interpreter.stats.cache('diskdict', hit)
+
+    def remember(self, key, value, dirty):
+        cache = self.cache
+        cache[key] = value
+        cache.move_to_end(key)
+        if dirty:
+            self.dirty.add(key)
+        while len(cache) > self.size:
+            old, old_value = cache.popitem(last=False)
+            if old in self.dirty:
+                self.dirty.discard(old)
+                self.pending[old] = encode(old_value)
+                if len(self.pending) >= BATCH:
+                    self.write()
+
+    def load(self, key):
+        """The value for key from outside the cache, or raises KeyError."""
+        blob = self.pending.get(key)
+        if blob is None:
+            row = self.db.execute("SELECT value FROM items WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                raise KeyError(key)
+            blob = row[0]
+        return decode(blob)
+
+    def __getitem__(self, key):
+        cache = self.cache
+        if key in cache:
+            self.note(True)
+            cache.move_to_end(key)
+            return cache[key]
+        self.note(False)
+        key = check_key(key)
+        value = self.load(key)
+        # A list or a dict could be changed in place once it's handed out, so it's written back when it leaves the cache
+        self.remember(key, value, not isinstance(value, IMMUTABLE))
+        return value
+
+    def __setitem__(self, key, value):
+        key = check_key(key)
+        if key not in self.cache:
+            self.pending.pop(key, None)
+        self.remember(key, value, True)
+
+    def __contains__(self, key):
+        if key in self.cache or key in self.pending:
+            return True
+        if not isinstance(key, (str, int, float)):
+            return False
+        return self.db.execute("SELECT 1 FROM items WHERE key = ?", (key,)).fetchone() is not None
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def remove(self, key):
+        """Takes key out, giving back its value."""
+        value = self[key]
+        self.cache.pop(key, None)
+        self.dirty.discard(key)
+        self.pending.pop(key, None)
+        self.db.execute("DELETE FROM items WHERE key = ?", (key,))
+        return value
+
+    def write(self):
+        # One transaction for the whole batch, committing each write on its own is what makes SQLite slow
+        if not self.pending:
+            return
+        with self.db:
+            self.db.execute("BEGIN")
+            self.db.executemany("INSERT OR REPLACE INTO items VALUES (?, ?)", self.pending.items())
+        self.pending.clear()
+
+    def sync(self):
+        """Writes every change out to the file, keeping the cache as it is."""
+        for key in self.dirty:
+            self.pending[key] = encode(self.cache[key])
+        self.dirty.clear()
+        self.write()
+
+    def close(self):
+        if self.db is None:
+            return
+        self.sync()
+        self.db.close()
+        self.db = None
+        _open.discard(self)
+
+    def __len__(self):
+        self.sync()
+        return self.db.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def keys(self):
+        """Every key, fetched from the file a page at a time in key order."""
+        self.sync()
+        last = None
+        while True:
+            if last is None:
+                page = self.db.execute("SELECT key FROM items ORDER BY key LIMIT ?", (PAGE,)).fetchall()
+            else:
+                page = self.db.execute("SELECT key FROM items WHERE key > ? ORDER BY key LIMIT ?", (last, PAGE)).fetchall()
+            if not page:
+                return
+            for (key,) in page:
+                yield key
+            last = page[-1][0]
+
+    def __iter__(self):
+        return self.keys()
+
+    def values(self):
+        return (self[key] for key in self.keys())
+
+    def items(self):
+        # Pairs as lists, nebula has no tuples
+        return ([key, self[key]] for key in self.keys())
+
+    def __repr__(self):
+        return f"diskdict({self.path!r})"
+
+    def __reduce__(self):
+        # Actors and images get the file, reopened on the other side
+        self.sync()
+        return (DiskDict, (self.path, self.size))
+
+def sync_all(interpreter=None):
+    """Writes out every open diskdict, or only the ones interpreter made.
+
+    The interpreter calls this when a script ends. Forked children (serve, actors, pmap) leave
+    through os._exit and scheduled scripts end long before the process does, so atexit isn't enough.
+    """
+    for table in list(_open):
+        if table.db is not None and (interpreter is None or table.interpreter is interpreter):
+            table.sync()
+
+atexit.register(sync_all)
+
+def diskdict(args, interpreter):
+    """diskdict(path, cache=10000) opens (or makes) the dictionary kept in the file at path."""
+    size = args[1] if len(args) > 1 else CACHE
+    if not isinstance(size, int) or size < 1:
+        raise ValueError("a diskdict's cache has to hold at least one key")
+    return DiskDict(args[0], size, interpreter)
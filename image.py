@@ -0,0 +1,132 @@
+"""Images: the state a script's definitions leave behind, saved so later runs can skip straight past them."""
+import sys, os, pickle
+sys.dont_write_bytecode = True
+
+MAGIC = 'nebula image 2'
+
+def definition(stmt, interpreter, seen=None):
+    """Whether a top-level statement only defines things: def, class, `name = include(...)`, or include.
+
+    `name = include(...)` only ever picks the defs and classes out of its file. `include "file"` runs
+    the whole file though, so it only counts when everything in the file (and what that includes)
+    is a definition too. Anything else there, like a print, has to run on every run.
+    """
+    if not isinstance(stmt, tuple) or not stmt:
+        return False
+    if stmt[0] in ('def', 'asyncdef', 'class'):
+        return True
+    if stmt[0] == 'include':
+        path = interpreter.include_path(stmt[1])
+        seen = seen if seen is not None else set()
+        if path in seen:
+            return True
+        seen.add(path)
+        try:
+            ast = interpreter.parse_file(path)
+        except Exception:
+            # Missing or doesn't parse, left for the run itself to fail on
+            return False
+        return all(definition(inner, interpreter, seen) for inner in ast)
+    return (stmt[0] == 'assign' and isinstance(stmt[2], tuple) and stmt[2][0] == 'call'
+            and stmt[2][1] == ('var', 'include'))
+
+class ImagePickler(pickle.Pickler):
+    """Pickles interpreter state, writing the interpreter's own global scope and builtins as references."""
+    def __init__(self, file, interpreter, builtins):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.interpreter = interpreter
+        self.builtins = {id(value): name for name, value in builtins.items() if callable(value)}
+        # main.py is usually __main__, so its classes are saved by name and looked up in whichever module it is when loading
+        self.module = sys.modules[type(interpreter).__module__]
+
+    def persistent_id(self, obj):
+        if obj is self.interpreter.global_scope:
+            return ('globals',)
+        if isinstance(obj, type) and getattr(self.module, obj.__name__, None) is obj:
+            return ('class', obj.__name__)
+        if callable(obj) and id(obj) in self.builtins:
+            return ('builtin', self.builtins[id(obj)])
+        return None
+
+    def reducer_override(self, obj):
+        # Function.__getstate__ copies the scope and drops the builtins, here both have to survive as references
+        if isinstance(obj, self.module.Function):
+            return restore_function, (type(obj), obj.params, obj.body, obj.scope, obj.types)
+        return NotImplemented
+
+class ImageUnpickler(pickle.Unpickler):
+    def __init__(self, file, interpreter):
+        super().__init__(file)
+        self.interpreter = interpreter
+
+    def persistent_load(self, pid):
+        if pid[0] == 'globals':
+            return self.interpreter.global_scope
+        if pid[0] == 'class':
+            return getattr(sys.modules[type(self.interpreter).__module__], pid[1])
+        return self.interpreter.global_scope[pid[1]]
+
+def restore_function(kind, params, body, scope, types=None):
+    return kind(params, body, scope, types)
+
+def snapshot(interpreter, script, path):
+    """Runs the definitions at the top of script and saves what they made to path.
+
+    Returns the statements after them, which haven't run yet.
+    """
+    builtins = dict(interpreter.global_scope)
+    sources = {}
+    parse_file = interpreter.parse_file
+    def tracked(source):
+        ast = parse_file(source)
+        sources[source] = version(source)
+        return ast
+    interpreter.parse_file = tracked
+    try:
+        ast = interpreter.parse_file(script)
+        count = 0
+        while count < len(ast) and definition(ast[count], interpreter):
+            interpreter.execute_block(ast[count:count + 1], interpreter.global_scope)
+            count += 1
+    finally:
+        del interpreter.parse_file
+
+    defined = {name: value for name, value in interpreter.global_scope.items()
+               if name not in builtins or builtins[name] is not value}
+    state = {'magic': MAGIC, 'script': script, 'sources': sources, 'rest': ast[count:],
+             'globals': defined, 'classes': interpreter.classs}
+    try:
+        with open(path + '.tmp', 'wb') as f:
+            ImagePickler(f, interpreter, builtins).dump(state)
+        os.replace(path + '.tmp', path)
+    except (pickle.PicklingError, TypeError, AttributeError) as e:
+        os.remove(path + '.tmp')
+        print(f"nebula: can't save an image of {script}: {e}", file=sys.stderr)
+    return ast[count:]
+
+def restore(interpreter, path, script):
+    """Loads the image at path into the interpreter and returns the statements left to run.
+
+    Returns None when there's no usable image: it's missing, for another script, or one of the
+    files it was made from has changed since.
+    """
+    try:
+        with open(path, 'rb') as f:
+            state = ImageUnpickler(f, interpreter).load()
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, KeyError, ImportError):
+        return None
+    if state.get('magic') != MAGIC or state['script'] != script:
+        return None
+    for source, saved in state['sources'].items():
+        if version(source) != saved:
+            return None
+    interpreter.global_scope.update(state['globals'])
+    interpreter.classs.update(state['classes'])
+    return state['rest']
+
+def version(source):
+    try:
+        st = os.stat(source)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
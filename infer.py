@@ -0,0 +1,300 @@
+"""Type inference over function bodies, and the specialized bodies it makes possible.
+
+A local is proven to hold one type when every assignment to it gives that type and it's assigned
+before anything could read it. Parameters are proven by their `:: <type>` annotations, which a
+guard checks on every call. Where both sides of an operator or a comparison are proven, the
+specialized body calls the operator directly instead of going through the generic checks. When
+the guard fails the function runs its body the normal way, so annotations still never raise.
+"""
+import sys, operator
+sys.dont_write_bytecode = True
+from collections import OrderedDict
+
+# Annotations the guard can check, and the Python types behind them
+TYPES = {'int': int, 'float': float, 'str': str, 'list': list}
+
+ARITHMETIC = {'+': operator.add, '-': operator.sub, '*': operator.mul, '/': operator.truediv, '%': operator.mod}
+COMPARISONS = {'==': operator.eq, '!=': operator.ne, '<': operator.lt, '>': operator.gt, '<=': operator.le, '>=': operator.ge}
+
+# What these builtins give back, for as long as the names still mean the builtins
+RESULTS = {'int': 'int', 'float': 'float', 'str': 'str', 'length': 'int', 'range': 'list'}
+
+# Nodes with a scope of their own, nothing inside them binds or is specialized for the function around them
+OWN_SCOPE = ('def', 'asyncdef', 'lambda', 'class')
+
+# A local that hasn't been given a type yet while the types settle
+UNSET = object()
+
+class Unprovable(Exception):
+    pass
+
+# How many functions' plans are kept, the least recently used goes first. A plan keeps its body alive,
+# so without a limit a long lived process (the serve daemon) would keep every function it ever ran
+SIZE = 1024
+
+# id(body): (body, plan or None), least recently used first
+_plans = OrderedDict()
+
+def specialized(function, scope, interpreter):
+    """The body to run for this call: the specialized one if the guard passes, the normal one if not."""
+    body = function.body
+    entry = _plans.get(id(body))
+    if entry is None or entry[0] is not body:
+        entry = _plans[id(body)] = (body, plan(function.params, body, function.types or {}))
+    _plans.move_to_end(id(body))
+    if len(_plans) > SIZE:
+        _plans.popitem(last=False)
+    if entry[1] is None:
+        return body
+    fast, checks, builtins = entry[1]
+    passed = (all(type(scope.get(name)) is kind for name, kind in checks)
+              and all(scope.get(name) is interpreter.builtins.get(name) for name in builtins))
+    if interpreter.stats is not None:
+        interpreter.stats.cache('specialized', passed)
+    return fast if passed else body
+
+def plan(params, body, annotations):
+    """(specialized body, parameter checks, builtins relied on), or None when nothing can be specialized."""
+    try:
+        env, builtins = infer(params, body, annotations)
+    except Unprovable:
+        return None
+    checks = [(name, TYPES[annotations[name]]) for name in env if name in annotations and name in param_names(params)]
+    fast, changed = rewrite(body, env, builtins)
+    if not changed:
+        return None
+    return fast, checks, sorted(builtins & mentions(body))
+
+def param_names(params):
+    return [param if isinstance(param, str) else param[0] for param in params]
+
+def infer(params, body, annotations):
+    """The proven type of every parameter and local that has one, and the builtins the proof needs."""
+    bindings = []
+    for stmt in body:
+        binds(stmt, bindings)
+    bound = {name for name, _ in bindings}
+
+    env = {}
+    for name in param_names(params):
+        if name.startswith('*'):
+            continue
+        # Parameters are only known through their annotations, and only if the body never rebinds them
+        if annotations.get(name) in TYPES and name not in bound:
+            env[name] = annotations[name]
+
+    # Builtins the body rebinds (or takes as parameters) are just variables
+    builtins = set(RESULTS) - bound - set(param_names(params))
+    candidates = first_assigned(body, bound - set(param_names(params)), bindings)
+    for name in candidates:
+        env[name] = UNSET
+
+    # Keep joining every binding's type into its name's until nothing changes
+    changed = True
+    while changed:
+        changed = False
+        for name, expr in bindings:
+            if name not in candidates or env.get(name) is None:
+                continue
+            kind = binding_type(expr, env, builtins)
+            if kind is UNSET:
+                continue
+            joined = kind if env[name] is UNSET or env[name] == kind else None
+            if joined != env[name]:
+                env[name] = joined
+                changed = True
+    return {name: kind for name, kind in env.items() if kind not in (None, UNSET)}, builtins
+
+def binds(node, bindings):
+    """Collects (name, how it gets its value) for everything node binds in the function's own scope."""
+    if isinstance(node, list):
+        for item in node:
+            binds(item, bindings)
+        return
+    if not isinstance(node, tuple) or not node:
+        return
+    kind = node[0]
+    if kind in ('ffi', 'include'):
+        # Either could write any name at all
+        raise Unprovable(kind)
+    if kind in OWN_SCOPE:
+        if kind in ('def', 'asyncdef') and '.' not in node[1]:
+            bindings.append((node[1], None))
+        return
+    if kind == 'assign':
+        bindings.append((node[1], node[2]))
+    elif kind == 'augassign':
+        bindings.append((node[1], ('binop', node[2][0], ('var', node[1]), node[3])))
+    elif kind == 'for':
+        bindings.append((node[1], ('item', node[2])))
+    elif kind == 'listcomp':
+        bindings.append((node[2], None))
+    elif kind == 'dictcomp':
+        bindings.append((node[3], None))
+    elif kind == 'try' and node[1] is not None:
+        bindings.append((node[1], ('str', '')))
+    elif kind == 'global':
+        bindings.append((node[1], None))
+    for child in children(node):
+        if isinstance(child, (tuple, list)):
+            binds(child, bindings)
+        elif isinstance(child, dict):
+            binds(list(child.values()), bindings)
+
+def children(node):
+    # Nodes start with their kind, other tuples in the tree (dict items, match cases) are all children
+    return node[1:] if isinstance(node[0], str) else node
+
+def first_assigned(body, names, bindings):
+    """The locals that get a value before anything can read the one they had outside the function.
+
+    That's a name first mentioned by a top-level assignment that doesn't read it, or one only ever
+    mentioned inside the for loops that bind it.
+    """
+    proven = set()
+    seen = set()
+    for stmt in body:
+        mentioned = mentions(stmt)
+        stmt = unwrap(stmt)
+        if stmt[0] == 'assign' and stmt[1] in names and stmt[1] not in seen and stmt[1] not in mentions(stmt[2]):
+            proven.add(stmt[1])
+        seen |= mentioned
+    loop_vars = {name for name, expr in bindings if isinstance(expr, tuple) and expr[0] == 'item'}
+    for name in loop_vars & names - proven:
+        if all(isinstance(expr, tuple) and expr[0] == 'item' for n, expr in bindings if n == name) and only_in_loops(body, name):
+            proven.add(name)
+    return proven
+
+def only_in_loops(node, name):
+    """Whether name only shows up inside for loops over it (and not in what they loop over)."""
+    if isinstance(node, list):
+        return all(only_in_loops(item, name) for item in node)
+    if isinstance(node, dict):
+        return only_in_loops(list(node.values()), name)
+    if not isinstance(node, tuple) or not node:
+        return True
+    if node[0] == 'for' and node[1] == name:
+        return name not in mentions(node[2]) and name not in mentions(node[3])
+    if node[0] == 'var' and node[1] == name:
+        return False
+    if node[0] in ('assign', 'augassign', 'global') and node[1] == name:
+        return False
+    return all(only_in_loops(child, name) for child in children(node))
+
+def mentions(node, found=None):
+    """Every name node reads or binds, including inside nested functions."""
+    found = set() if found is None else found
+    if isinstance(node, list):
+        for item in node:
+            mentions(item, found)
+    elif isinstance(node, dict):
+        mentions(list(node.values()), found)
+    elif isinstance(node, tuple) and node:
+        if node[0] in ('var', 'assign', 'augassign', 'global', 'for', 'try') and isinstance(node[1], str):
+            found.add(node[1])
+        elif node[0] == 'listcomp':
+            found.add(node[2])
+        elif node[0] == 'dictcomp':
+            found.add(node[3])
+        for child in children(node):
+            mentions(child, found)
+    return found
+
+def unwrap(node):
+    # Some nodes come out of the parser wrapped in a tuple of their own, execute unwraps them the same way
+    while isinstance(node, tuple) and len(node) == 1 and isinstance(node[0], tuple):
+        node = node[0]
+    return node
+
+def binding_type(expr, env, builtins):
+    if expr is None:
+        return None
+    if expr[0] == 'item':
+        # A for loop over range() only ever gives ints
+        iterable = unwrap(expr[1])
+        return 'int' if calls(iterable, builtins) == 'range' else None
+    return type_of(expr, env, builtins)
+
+def calls(node, builtins):
+    """The builtin a call node calls, if it's one whose result is known."""
+    if node[0] == 'call' and unwrap(node[1])[0] == 'var' and unwrap(node[1])[1] in builtins:
+        args = node[2]
+        kwargs = node[3] if len(node) > 3 else {}
+        if not kwargs and not any(isinstance(arg, tuple) and arg[0] in ('unpack', 'kwunpack') for arg in args):
+            return unwrap(node[1])[1]
+    return None
+
+def type_of(node, env, builtins):
+    """The type an expression is proven to have: a name from TYPES, 'bool', UNSET while it's still settling, or None."""
+    node = unwrap(node)
+    kind = node[0]
+    if kind == 'num':
+        return 'float' if type(node[1]) is float else 'int' if type(node[1]) is int else None
+    if kind == 'str':
+        return 'str'
+    if kind in ('list', 'listcomp'):
+        return 'list'
+    if kind == 'var':
+        return env.get(node[1])
+    if kind in ('compare', 'in', 'nin', 'not'):
+        return 'bool'
+    if kind == 'call':
+        name = calls(node, builtins)
+        return RESULTS[name] if name is not None else None
+    if kind == 'binop':
+        a, b = type_of(node[2], env, builtins), type_of(node[3], env, builtins)
+        if a is UNSET or b is UNSET:
+            return UNSET
+        return arithmetic(node[1], a, b)
+    return None
+
+def arithmetic(op, a, b):
+    """The type of a op b for proven a and b, None if it isn't one of ours or could raise."""
+    if a in ('int', 'float') and b in ('int', 'float'):
+        if op == '/':
+            return 'float'
+        return 'float' if 'float' in (a, b) else 'int'
+    if op == '+' and a == b and a in ('str', 'list'):
+        return a
+    if op == '*' and {a, b} in ({'str', 'int'}, {'list', 'int'}):
+        return a if a != 'int' else b
+    return None
+
+def comparable(op, a, b):
+    if op in ('==', '!='):
+        return a is not None and b is not None
+    return (a in ('int', 'float') and b in ('int', 'float')) or a == b == 'str'
+
+def rewrite(node, env, builtins):
+    """Node with every operator whose operand types are proven swapped for a direct ('typed', fn, a, b) call.
+
+    Gives back (node, whether anything changed).
+    """
+    if isinstance(node, list):
+        items = [rewrite(item, env, builtins) for item in node]
+        return [item for item, _ in items], any(changed for _, changed in items)
+    if isinstance(node, dict):
+        items = {key: rewrite(value, env, builtins) for key, value in node.items()}
+        return {key: item for key, (item, _) in items.items()}, any(changed for _, changed in items.values())
+    # Comprehensions are left as they are for vectorize.py, which looks for the plain operators
+    if not isinstance(node, tuple) or not node or node[0] in OWN_SCOPE or node[0] in ('listcomp', 'dictcomp'):
+        return node, False
+    kind = node[0]
+    if kind in ('binop', 'compare'):
+        a, b = type_of(node[2], env, builtins), type_of(node[3], env, builtins)
+        if kind == 'binop' and arithmetic(node[1], a, b) is not None:
+            fn = ARITHMETIC[node[1]]
+        elif kind == 'compare' and comparable(node[1], a, b):
+            fn = COMPARISONS[node[1]]
+        else:
+            fn = None
+        if fn is not None:
+            left, right = rewrite(node[2], env, builtins)[0], rewrite(node[3], env, builtins)[0]
+            return ('typed', fn, left, right), True
+    children = [rewrite(child, env, builtins) for child in node[1:]]
+    if not any(changed for _, changed in children):
+        return node, False
+    rebuilt = type(node)((kind, *(child for child, _ in children)))
+    if hasattr(node, 'line'):
+        rebuilt.file, rebuilt.line = node.file, node.line
+    return rebuilt, True
@@ -6,9 +6,32 @@ VERSION = 1.05
 import sys, os
 sys.dont_write_bytecode = True
 import re
+import time
 import operator
-from preprocess import Tokenizer
+import linecache
+from itertools import islice
+from collections.abc import Iterator
+from preprocess import Tokenizer, LineTokenizer
 from parser import Parser 
+from pybridge import PyCallable, py_value, pyimport, load_plugins, method, attribute
+from infer import specialized
+from output import OUTPUT, unescape, fmt
+from containers import Heap, COLLECTIONS, constructor, most_common, counter_add, deque, Counter
+from strbuf import StrBuf, strbuf, plus
+import regex
+from records import jsonl_read, jsonl_write, csv_read, csv_write
+from diskdict import DiskDict, diskdict, sync_all
+from views import ListView, LISTS, view, changing, python_value
+
+# Nebula's own values, which only have the attributes nebula gives them (see Interpreter.python_object)
+NEBULA_TYPES = {str, int, float, bool, list, ListView, tuple, dict, type(None)}
+
+# Parsed files by absolute path, along with the (mtime, size) they were parsed at. Lives as long as the process, which only matters in the serve daemon
+PARSED = {}
+# Compiled ffi blocks by their source
+FFI_CODE = {}
+# Comprehensions over fewer items than this aren't worth turning into arrays
+VECTORIZE_MIN = 64
 
 """Since Python Exceptions are classes it makes since to do the same here."""
 class BreakSignal(Exception): pass
@@ -25,18 +48,40 @@ class Typecast:
     def list(arg): return list(arg[0])
     def dict(arg): return dict(arg[0])
 
+def is_array(value):
+    # Arrays can only exist once array() has imported numeric.py, so until then there's nothing to check
+    numeric = sys.modules.get('numeric')
+    return numeric is not None and isinstance(value, numeric.ARRAYS)
+
+def is_table(value):
+    # The same goes for tables and table.py
+    table = sys.modules.get('table')
+    return table is not None and isinstance(value, table.Table)
+
+class Keywords:
+    """A builtin whose arguments can also be given by name.
+
+    It has params like a nebula function, so a call binds keywords to the right position the same
+    way, instead of tacking them on the end. Optional arguments left out come in as None.
+    """
+    def __init__(self, fn, required, optional=()):
+        self.fn = fn
+        self.params = [(name, None) for name in required] + [(name, ('var', 'None')) for name in optional]
+
+    def __call__(self, args, interpreter):
+        return self.fn(args, interpreter)
+
 class Builtins:
     """Provides a set of builtin functions to our language."""
     def type(args):
-        return type(args[0]).__name__
+        # A slice that's a view is still a list to the script
+        return 'list' if type(args[0]) is ListView else type(args[0]).__name__
     
     def print(args):
         # repr() prints the proper way since it may expand lists [1, 2, 3] into 1 2 3 when we don't want that
-        print(*[repr(a) for a in args])
+        OUTPUT.write(' '.join(map(repr, args)) + '\n')
 
     def printf(args):
-        # we only use codecs here so it makes sense for readability
-        import codecs
         # printf takes a seperator and an end char
         values, sep, end = args[:-2], ' ', '\n'
         if len(args) >= 2:
@@ -45,15 +90,12 @@ class Builtins:
             end = args[-1]
             
             values = []
-        def fmt(v):
-            if isinstance(v, str):
-                return v
-            else:
-                return repr(v)
-        end = codecs.decode(end, 'unicode_escape')
-        print(sep.join(fmt(v) for v in values), end=end)
+        # Escapes in sep and end are decoded once per distinct string, see output.py
+        OUTPUT.write(unescape(sep).join(map(fmt, values)) + unescape(end))
 
     def input(args):
+        # Whatever's buffered (like a prompt printed with printf) has to be out before we wait on the user
+        OUTPUT.flush()
         # Check if a prompt was provided
         if not args:
             inp = input()
@@ -108,13 +150,96 @@ class Builtins:
             return reduce(lambda a, b: fn([a, b], interpreter), iterable)
         else:
             raise Exception("reduce expects 2 or 3 arguments")
+
+    def pmap(args, interpreter, keep=False):
+        # Only pulled in when a script actually asks for it
+        from parallel import pmap
+        return pmap(args, interpreter, keep)
+
+    def array(args, interpreter):
+        # NumPy (if there is one) only gets imported once a script makes an array, see numeric.py
+        from numeric import array
+        return array(args, interpreter)
+
+    def reduction(name, args):
+        # sum, min, max and mean take a list, an array or the numbers themselves
+        values = args[0] if len(args) == 1 else args
+        if is_array(values):
+            from numeric import reduction
+            return reduction(name, values)
+        if name == 'mean':
+            return sum(values) / len(values)
+        return {'sum': sum, 'min': min, 'max': max}[name](values)
+
+    def spawn(args, interpreter):
+        # Runs a function in its own process, see actors.py
+        from actors import Actor
+        if len(args) not in (1, 2):
+            raise Exception("spawn expects a function and optionally a list of arguments")
+        return {'__type__': '__actor__', '__actor__': Actor(args[0], args[1] if len(args) == 2 else [], interpreter)}
+
+    def aio(name):
+        # asyncio is only imported once a script uses one of these, see aio.py
+        def builtin(args, interpreter):
+            import aio
+            return getattr(aio, name)(args, interpreter)
+        return builtin
+
+    def table(name):
+        # Tables bring in numeric.py (and NumPy if it's there), so only once a script makes one, see table.py
+        def builtin(args, interpreter):
+            import table
+            return getattr(table, name)(args, interpreter)
+        return builtin
+
+    def memstats(interpreter):
+        # Only pulled in when a script actually asks for it
+        from memstats import snapshot
+        return snapshot(interpreter)
     
+class FFIScope:
+    """What an ffi block sees as its variables: the nebula scope itself, so nothing gets copied in or out.
+
+    Nebula's callables are hidden, they can't be called from Python anyway and they would shadow
+    Python's builtins. Anything callable the block makes (a def, an import from) stays in the
+    block, like before.
+    """
+    def __init__(self, scope):
+        self.scope = scope
+        self.own = {}
+
+    def __getitem__(self, name):
+        if name in self.own:
+            return self.own[name]
+        value = self.scope[name]
+        if callable(value):
+            raise KeyError(name)
+        # The block can change lists in place like any Python code
+        return python_value(value)
+
+    def __setitem__(self, name, value):
+        if callable(value):
+            self.own[name] = value
+        else:
+            self.own.pop(name, None)
+            self.scope[name] = value
+
+    def __delitem__(self, name):
+        if name in self.own:
+            del self.own[name]
+        else:
+            del self.scope[name]
+
 class Function:
     """Creates a function object to execute, but since our language isn't native Python, overwrite __call__ dunder to execute."""
-    def __init__(self, params, body, scope):
+    # The :: <type> annotations by name, see infer.py
+    types = None
+
+    def __init__(self, params, body, scope, types=None):
         self.params = params
         self.body = body
         self.scope = scope
+        self.types = types
 
     def __call__(self, args, interpreter):
         local_scope = self.scope.copy()
@@ -139,7 +264,7 @@ class Function:
 
         # Assign positional arguments to a single fixed param
         for i, (name, default_expr) in enumerate(fixed_params):
-            if i < len(str(args)):
+            if i < len(args):
                 local_scope[name] = args[i]
             elif default_expr is not None:
                 local_scope[name] = interpreter.execute(default_expr, local_scope)
@@ -171,7 +296,43 @@ class Function:
         if remaining:
             raise TypeError(f"Too many arguments provided")
 
-        return interpreter.execute_block(self.body, local_scope)
+        if interpreter.stats is not None:
+            interpreter.stats.calls += 1
+        # Runs the body specialized for the proven types when the arguments match the annotations
+        return interpreter.execute_block(specialized(self, local_scope, interpreter), local_scope)
+
+    def __getstate__(self):
+        # Python builtins can't be pickled, whichever interpreter unpickles this gives them back (see parallel.adopt)
+        scope = {k: v for k, v in self.scope.items() if not callable(v) or isinstance(v, (Function, Constructor))}
+        return {'params': self.params, 'body': self.body, 'scope': scope, 'types': self.types}
+
+class AsyncFunction(Function):
+    """A function defined with async def. Calling it gives back a coroutine, the body only runs once that's awaited."""
+    def __call__(self, args, interpreter):
+        from aio import Coroutine
+        return Coroutine(self, args, interpreter)
+
+    def run(self, args, interpreter):
+        return Function.__call__(self, args, interpreter)
+
+class Constructor:
+    """Creates new instances of a class. A class instead of a closure so it can be pickled along with functions."""
+    def __init__(self, name, fields, nested_map):
+        self.name = name
+        self.fields = fields
+        self.nested_map = nested_map
+
+    def __call__(self, args, interpreter):
+        instance = {'__type__': self.name}
+        for i, (field_name, default_expr) in enumerate(self.fields):
+            if i < len(args):
+                instance[field_name] = args[i]
+            elif default_expr is not None:
+                val = interpreter.execute_with_nested_map(default_expr, interpreter.global_scope, self.nested_map)
+                instance[field_name] = val
+            else:
+                instance[field_name] = None
+        return instance
 
 class Interpreter(Tokenizer, Parser):
     """Main interpreter class."""
@@ -185,19 +346,97 @@ class Interpreter(Tokenizer, Parser):
             'lower': lambda s: s.lower(),
             'join': lambda self, iterable: self.join([str(x) for x in iterable]),
             'split': lambda s, delim=' ': s.split(delim),
-            'strip': lambda s: s.strip()
+            'strip': lambda s: s.strip(),
+            'encode': lambda s, encoding='utf-8': s.encode(encoding),
         }
 
+        # Anything that changes a list in place goes through changing() first, so slices taken of it keep what they had
         self.list_methods = {
-            'append': lambda l, i: l.append(i),
-            'extend': lambda l, i: l.extend(i),
-            'remove': lambda l, i: l.remove(i),
-            'sort': lambda l, i=False: l.sort(reverse = i),
-            'reverse': lambda l: l.reverse(),
-            'pop': lambda l: l.pop(),
+            'append': lambda l, i: changing(l).append(i),
+            'extend': lambda l, i: changing(l).extend(i),
+            'remove': lambda l, i: changing(l).remove(i),
+            'sort': lambda l, i=False: changing(l).sort(reverse = i),
+            'reverse': lambda l: changing(l).reverse(),
+            'pop': lambda l: changing(l).pop(),
             'index': lambda l, i: l.index(i),
         }
 
+        self.set_methods = {
+            'add': lambda s, i: s.add(i),
+            'remove': lambda s, i: s.remove(i),
+            'discard': lambda s, i: s.discard(i),
+            'pop': lambda s: s.pop(),
+            'clear': lambda s: s.clear(),
+            'update': lambda s, i: s.update(i),
+            'union': lambda s, i: s.union(i),
+            'intersect': lambda s, i: s.intersection(i),
+            'difference': lambda s, i: s.difference(i),
+            'issubset': lambda s, i: s.issubset(i),
+        }
+
+        self.deque_methods = {
+            'push': lambda d, i: d.append(i),
+            'pushleft': lambda d, i: d.appendleft(i),
+            'pop': lambda d: d.pop(),
+            'popleft': lambda d: d.popleft(),
+            'extend': lambda d, i: d.extend(i),
+            'extendleft': lambda d, i: d.extendleft(i),
+            'rotate': lambda d, n=1: d.rotate(n),
+            'clear': lambda d: d.clear(),
+        }
+
+        self.heap_methods = {
+            'push': lambda h, i: h.push(i),
+            'pop': lambda h: h.pop(),
+            'peek': lambda h: h.peek(),
+            'clear': lambda h: h.items.clear(),
+        }
+
+        self.counter_methods = {
+            'add': counter_add,
+            'update': lambda c, i: c.update(i),
+            'most_common': most_common,
+            'total': lambda c: sum(c.values()),
+            'keys': lambda c: list(c),
+        }
+
+        self.strbuf_methods = {
+            'append': lambda b, s: b.append(s),
+            'extend': lambda b, l: b.extend(l),
+            'build': lambda b: b.build(),
+            'clear': lambda b: b.clear(),
+        }
+
+        self.match_methods = {
+            'group': lambda m, n=0: m.group(n),
+            'groups': lambda m: list(m.groups()),
+            'named': lambda m: m.groupdict(),
+            'start': lambda m, n=0: m.start(n),
+            'end': lambda m, n=0: m.end(n),
+            'span': lambda m, n=0: list(m.span(n)),
+        }
+
+        self.diskdict_methods = {
+            'get': lambda d, k, default=None: d.get(k, default),
+            'remove': lambda d, k: d.remove(k),
+            'keys': lambda d: d.keys(),
+            'values': lambda d: d.values(),
+            'items': lambda d: d.items(),
+            'sync': lambda d: d.sync(),
+            'close': lambda d: d.close(),
+        }
+
+        # Method tables for the collections (and regex matches) that are Python objects themselves, by their type
+        self.collection_methods = {
+            set: self.set_methods,
+            deque: self.deque_methods,
+            Heap: self.heap_methods,
+            Counter: self.counter_methods,
+            StrBuf: self.strbuf_methods,
+            regex.Match: self.match_methods,
+            DiskDict: self.diskdict_methods,
+        }
+
         self.file_methods = {
             'read': lambda f: f.read(),
             'write': lambda f, data: f.write(data),
@@ -206,9 +445,30 @@ class Interpreter(Tokenizer, Parser):
             'readline': lambda f: f.readline(),
         }
 
+        self.actor_methods = {
+            'send': lambda a, value: a.send(value),
+            'recv': lambda a: a.recv(),
+            'poll': lambda a, timeout=0: a.poll(timeout),
+            'join': lambda a: a.join(),
+        }
+
+        self.channel_methods = {
+            'send': lambda c, value: c.send(value),
+            'recv': lambda c: c.recv(),
+            'poll': lambda c, timeout=0: c.poll(timeout),
+        }
+
+        # Method tables for the builtin objects that live inside {'__type__': name, name: object} dicts
+        self.native_methods = {
+            '__file__': self.file_methods,
+            '__actor__': self.actor_methods,
+            '__channel__': self.channel_methods,
+        }
+
         self.global_scope = {
             'print': lambda args, _: Builtins.print(args),
             'printf': lambda args, _: Builtins.printf(args),
+            'flush': lambda args, _: OUTPUT.flush(),
             'range': lambda args, _: Builtins.range(args),
             'input': lambda args, _: Builtins.input(args),
             'type': lambda args, _: Builtins.type(args),
@@ -217,17 +477,48 @@ class Interpreter(Tokenizer, Parser):
             'str': lambda args, _: Typecast.string(args),
             'list': lambda args, _: Typecast.list(args),
             'dict': lambda args, _: Typecast.dict(args),
+            'set': constructor(set),
+            'deque': constructor(deque),
+            'heap': constructor(Heap),
+            'counter': constructor(Counter),
+            'strbuf': strbuf,
             'length': lambda args, _: len(args[0]),
             'open': lambda args, _: Builtins.open(args),
+            'jsonl_read': jsonl_read,
+            'jsonl_write': jsonl_write,
+            'csv_read': csv_read,
+            'csv_write': csv_write,
+            'diskdict': diskdict,
+            'table': Builtins.table('table'),
+            'table_csv': Builtins.table('table_csv'),
+            'table_jsonl': Builtins.table('table_jsonl'),
             'map': lambda args, interpreter: Builtins.map(args, interpreter),
             'filter': lambda args, interpreter: Builtins.filter(args, interpreter),
             'reduce': lambda args, interpreter: Builtins.reduce(args, interpreter),
+            'pmap': Keywords(lambda args, interpreter: Builtins.pmap(args, interpreter), ['fn', 'iterable'], ['workers', 'chunksize']),
+            'pfilter': Keywords(lambda args, interpreter: Builtins.pmap(args, interpreter, keep=True), ['fn', 'iterable'], ['workers', 'chunksize']),
+            'spawn': lambda args, interpreter: Builtins.spawn(args, interpreter),
+            'aread': Builtins.aio('aread'),
+            'awrite': Builtins.aio('awrite'),
+            'arun': Builtins.aio('arun'),
+            'sleep': Builtins.aio('sleep'),
+            'gather': Builtins.aio('gather'),
+            'array': lambda args, interpreter: Builtins.array(args, interpreter),
+            'sum': lambda args, _: Builtins.reduction('sum', args),
+            'min': lambda args, _: Builtins.reduction('min', args),
+            'max': lambda args, _: Builtins.reduction('max', args),
+            'mean': lambda args, _: Builtins.reduction('mean', args),
             'chr': lambda args, _: chr(args[0]),
             'all': lambda args, _: all(args),
             'any': lambda args, _: any(args),
             'pow': lambda args, _: pow(args[0], args[1]),
             'ord': lambda args, _: ord(args[0]),
             'include': self.include_module,
+            'pyimport': pyimport,
+            'regex': dict(regex.FUNCTIONS),
+            '__memstats': lambda args, interpreter: Builtins.memstats(interpreter),
+            '__stats': lambda args, interpreter: interpreter.stats.as_dict() if interpreter.stats is not None else None,
+            '__quota': lambda args, interpreter: interpreter.quota.as_dict() if interpreter.quota is not None else None,
             'True': True,
             'False': False,
             'None': None,
@@ -235,6 +526,23 @@ class Interpreter(Tokenizer, Parser):
             '__argv': sys.argv
         }
 
+        # Set by memstats.MemStats while --memstats is tracking allocations
+        self.memstats = None
+        # Set by stats.Stats while --stats is counting
+        self.stats = None
+        # Set by quota.Quota while the script runs on a budget
+        self.quota = None
+        # Set by vectorize.Report with --vectorize-report
+        self.vector_report = None
+        # The asyncio loop behind await, see event_loop()
+        self.aio = None
+
+        # The builtins before plugins or scripts can replace them, infer.py only trusts what these give back
+        self.builtins = dict(self.global_scope)
+
+        # Plugins add their builtins last, so they can replace ours
+        load_plugins(self)
+
         self.bodmas = {
             '+': (10, 'left'),
             '-': (10, 'left'),
@@ -243,12 +551,52 @@ class Interpreter(Tokenizer, Parser):
             '%': (20, 'left'),
         }
 
-    def run(self, code):
+    def run(self, code, filename=None):
         """Entrypoint"""
         tokens = self.tokenize(code)
-        ast = self.parse(tokens)
-        return self.execute_block(ast, self.global_scope)
+        ast = self.parse(tokens, filename)
+        try:
+            return self.execute_block(ast, self.global_scope)
+        finally:
+            OUTPUT.flush()
+            sync_all(self)
             
+    def register(self, name, value, raw=False):
+        """Adds a builtin. Python functions are called with their own arguments, or with nebula's (args, interpreter) if raw."""
+        self.global_scope[name] = value if raw else py_value(value)
+
+    def run_file(self, path):
+        """Runs a script from a file."""
+        try:
+            return self.execute_block(self.parse_file(path), self.global_scope)
+        finally:
+            OUTPUT.flush()
+            sync_all(self)
+
+    def parse_file(self, path):
+        """Tokenizes and parses a file, or gives back the tree from last time if the file hasn't changed since."""
+        st = os.stat(path)
+        version = (st.st_mtime_ns, st.st_size)
+        # By where the file really is, the serve daemon's children each run in their client's directory
+        key = os.path.abspath(path)
+        cached = PARSED.get(key)
+        if self.stats is not None:
+            self.stats.cache('parse', cached is not None and cached[0] == version)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        with open(path, 'r') as f:
+            code = f.read()
+        ast = self.parse(self.tokenize(code), path)
+        PARSED[key] = (version, ast)
+        return ast
+
+    def event_loop(self):
+        """The event loop await runs on, started the first time something is awaited (again after a fork)."""
+        if self.aio is None or self.aio.pid != os.getpid():
+            from aio import EventLoop
+            self.aio = EventLoop()
+        return self.aio
+
     def current(self):
         """Returns the current token position."""
         return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
@@ -268,6 +616,18 @@ class Interpreter(Tokenizer, Parser):
                 return result[1]
         return result
 
+    def execute_lazy_for(self, var_name, iterable, step, body, scope):
+        """A for loop over an iterator, taking every step-th item as it comes."""
+        for item in islice(iterable, 0, None, step):
+            scope[var_name] = item
+            try:
+                self.execute_block(body, scope)
+            except ContinueSignal:
+                continue
+            except BreakSignal:
+                break
+        return None
+
     def execute(self, node, scope):
         """Executes just a node (token within tokens)."""
         # This will probably break, however some nodes like nin parse incorrectly
@@ -275,25 +635,20 @@ class Interpreter(Tokenizer, Parser):
             node = node[0]
 
         kind = node[0]
+        # Operators infer.py proved the operand types of, first since they're what specialized functions run most
+        if kind == 'typed':
+            return node[1](self.execute(node[2], scope), self.execute(node[3], scope))
+
         if kind == 'include':
             _, filename = node
-            current_file_dir = os.path.dirname(sys.argv[1])
-            
-            # Try resolving the import relative to current file 
-            included_path = os.path.normpath(os.path.join(current_file_dir, filename))
-
-            # If not found there, try the filename as is 
-            if not os.path.exists(included_path):
-                included_path = os.path.normpath(filename) 
-            
+            included_path = self.include_path(filename)
             try:
-                with open(included_path, 'r') as f:
-                    code = f.read()
+                ast = self.parse_file(included_path)
             except FileNotFoundError:
                 raise Exception(f"Included file '{filename}' not found (tried '{included_path}')")
 
-            tokens = self.tokenize(code)
-            ast = self.parse(tokens)
+            if self.stats is not None:
+                self.stats.includes += 1
             self.execute_block(ast, scope)
             return None
         
@@ -354,6 +709,17 @@ class Interpreter(Tokenizer, Parser):
             values = []
             iter_val = self.execute(iterable, scope)
             step_val = self.execute(step, scope)
+            if type(iter_val) in COLLECTIONS or isinstance(iter_val, (Iterator, DiskDict)) or is_table(iter_val):
+                iter_val = list(iter_val)
+            elif type(iter_val) is ListView:
+                # The result is as long as the slice anyway, and a list can be vectorized
+                iter_val = iter_val.tolist()
+            # Big numeric comprehensions can run on whole arrays at once, see vectorize.py
+            if len(iter_val) >= VECTORIZE_MIN and (type(iter_val) is list or is_array(iter_val)):
+                from vectorize import run
+                bulk = run(self, node, iter_val, step_val, scope)
+                if bulk is not None:
+                    return bulk
             for i in range(0, len(iter_val), step_val):
                 item = iter_val[i]
                 scope[var] = item
@@ -417,7 +783,7 @@ class Interpreter(Tokenizer, Parser):
         # augmented assignment e.g. a += 1, p.x += 1, a[0] += 1
         if kind in ('augassign', 'augassignattr', 'augassignindex'):
             ops = {
-                '+=': operator.add, 
+                '+=': plus,
                 '-=': operator.sub,
                 '*=': operator.mul,
                 '/=': operator.truediv,
@@ -437,6 +803,7 @@ class Interpreter(Tokenizer, Parser):
             if kind == 'augassignindex':
                 _, arr_expr, idx_expr, op, val_expr = node
                 arr = self.execute(arr_expr, scope); idx = self.execute(idx_expr, scope)
+                if type(arr) is list: changing(arr)
                 arr[idx] = ops[op](arr[idx], self.execute(val_expr, scope)); return None
 
         if kind == 'binop':
@@ -452,7 +819,8 @@ class Interpreter(Tokenizer, Parser):
         if kind == 'setindex':
             _, obj_expr, idx_expr, val_expr = node
             obj = self.execute(obj_expr, scope); idx = self.execute(idx_expr, scope); val = self.execute(val_expr, scope)
-            if isinstance(obj, (list, dict)): obj[idx] = val; return val
+            if type(obj) is list: changing(obj)
+            if isinstance(obj, (list, dict, DiskDict, ListView)) or is_array(obj): obj[idx] = val; return val
             raise TypeError(f"Cannot index-assign to non-list/dict object: {obj}")
 
         if kind == 'compare':
@@ -475,12 +843,15 @@ class Interpreter(Tokenizer, Parser):
                     '<=': a_val <= b_val,
                     '>=': a_val >= b_val
                 }[op]
+            elif is_array(a_val) or is_array(b_val):
+                # Elementwise, giving back a mask
+                return {'<': operator.lt, '>': operator.gt, '<=': operator.le, '>=': operator.ge}[op](a_val, b_val)
             else:
                 raise TypeError(f"Cannot compare with operator '{op}' between {type(a_val)} and {type(b_val)}")
 
-        if kind == 'def':
-            _, name, params, body = node
-            func = Function(params, body, scope)
+        if kind == 'def' or kind == 'asyncdef':
+            _, name, params, body, types = node
+            func = AsyncFunction(params, body, scope, types) if kind == 'asyncdef' else Function(params, body, scope, types)
             # If we're defining a method:
             if '.' in name:
                 class_name, method_name = name.split('.', 1)
@@ -508,7 +879,17 @@ class Interpreter(Tokenizer, Parser):
             else:
                 func_expr, args, kwargs = node[1], node[2], node[3]
 
-            func = self.execute(func_expr, scope)
+            # obj.method(...) on a Python object runs the function behind the method with obj, nothing gets wrapped or bound
+            owner = None
+            if func_expr[0] == 'getattr' and type(func_expr[2]) is str:
+                obj = self.execute(func_expr[1], scope)
+                func = method(obj, func_expr[2]) if self.python_object(obj) else None
+                if func is None:
+                    func = self.get_attribute(obj, func_expr[2])
+                else:
+                    owner = obj
+            else:
+                func = self.execute(func_expr, scope)
 
             # Evaluate and unpack positional arguments (*args)
             eval_args = []
@@ -517,7 +898,7 @@ class Interpreter(Tokenizer, Parser):
                 if isinstance(arg, tuple):
                     if arg[0] == 'unpack':
                         unpacked = self.execute(arg[1], scope)
-                        if not isinstance(unpacked, (list, tuple)):
+                        if not isinstance(unpacked, (list, tuple, ListView)):
                             raise TypeError("Can only unpack lists or tuples with *")
                         eval_args.extend(unpacked)
 
@@ -601,6 +982,20 @@ class Interpreter(Tokenizer, Parser):
                 final_args = eval_args + list(eval_kwargs.values())
 
             if callable(func):
+                # Python functions get their own arguments back, keywords and all
+                if type(func) is PyCallable:
+                    if self.stats is not None:
+                        self.stats.builtin_calls += 1
+                    # Python code writes to sys.stdout itself, so what nebula printed goes first
+                    if OUTPUT.parts:
+                        OUTPUT.flush()
+                    # Python code may change the lists it's given, views included
+                    eval_args = [python_value(arg) for arg in eval_args]
+                    if owner is not None:
+                        eval_args.insert(0, owner)
+                    return py_value(func.fn(*eval_args, **{key: python_value(value) for key, value in eval_kwargs.items()}))
+                if self.stats is not None and not isinstance(func, Function):
+                    self.stats.builtin_calls += 1
                 return func(final_args, self)
 
             # If the function is a class method:
@@ -644,89 +1039,7 @@ class Interpreter(Tokenizer, Parser):
         if kind == 'getattr':
             obj = self.execute(node[1], scope)
             attr = self.execute(node[2], scope) if isinstance(node[2], tuple) else node[2]
-
-            # class method resolution (user-defined)
-            def find_in_class_chain(class_type, attr):
-                checked = set()
-                def search(cls):
-                    if cls in checked or cls not in self.classs:
-                        return None
-                    checked.add(cls)
-                    class_info = self.classs[cls]
-                    methods = class_info.get('__methods__', {})
-                    method_key_options = [attr, f'{cls}.{attr}', f'self.{attr}']
-                    for method_key in method_key_options:
-                        if method_key in methods:
-                            return methods[method_key]
-                    # Check for field (fix: check field names, not tuples)
-                    if any(field_name == attr for field_name, _ in class_info.get('fields', [])):
-                        return 'field'
-                    # Search parents
-                    for parent in class_info.get('parents', []):
-                        found = search(parent)
-                        if found:
-                            return found
-                    return None
-                return search(class_type)
-            
-            if isinstance(obj, dict) and '__type__' in obj:
-                class_type = obj['__type__']
-                found = find_in_class_chain(class_type, attr)
-
-                if callable(found):
-                    def bound_method(args, interpreter):
-                        return found([obj] + args, interpreter)
-                    return bound_method
-                
-                if found == 'field':
-                    return obj.get(attr, None)
-                
-                # List available fields and methods for better error
-                available = list(obj.keys())
-                # Add all methods from class chain
-
-                def collect_methods(cls, acc):
-                    if cls not in self.classs:
-                        return
-                    class_info = self.classs[cls]
-                    acc.update(class_info.get('__methods__', {}).keys())
-                    for parent in class_info.get('parents', []):
-                        collect_methods(parent, acc)
-
-                method_set = set()
-                collect_methods(class_type, method_set)
-                available += list(method_set)
-                if class_type == '__file__':
-                    file_obj = obj['__file__']
-                    if attr in self.file_methods:
-                        return lambda args, interpreter: self.file_methods[attr](file_obj, *args)
-
-                raise AttributeError(f"Object of type '{class_type}' has no attribute '{attr}'. Available: {available}")
-
-            # Built-in string method resolution
-            if isinstance(obj, str) and attr in self.string_methods:
-                def bound_str_method(args, _):
-                    return self.string_methods[attr](obj, *args)
-                return bound_str_method
-            
-            # Built-in list method resolution
-            if isinstance(obj, list) and attr in self.list_methods:
-                def bound_str_method(args, _):
-                    return self.list_methods[attr](obj, *args)
-                return bound_str_method
-            
-            # File method resolution
-            if isinstance(obj, dict) and obj.get('__type__') == '__file__':
-                if attr in self.file_methods:
-                    def bound_file_method(args, _):
-                        return self.file_methods[attr](obj['__file__'], *args)
-                    return bound_file_method
-
-            # Native attribute access for dicts or objects
-            try:
-                return obj[attr]
-            except (TypeError, KeyError):
-                raise AttributeError(f"Object has no attribute '{attr}'")
+            return self.get_attribute(obj, attr)
         elif kind == 'setattr':
             _, obj_expr, attr_expr, value_expr = node
             obj = self.execute(obj_expr, scope)
@@ -736,8 +1049,10 @@ class Interpreter(Tokenizer, Parser):
             if obj is None:
                 raise RuntimeError(f"Attempted to assign to index {attr} on null object: {obj_expr}")
 
-            if not isinstance(obj, dict) and not isinstance(obj, list):
+            if not isinstance(obj, dict) and not isinstance(obj, LISTS):
                 raise TypeError(f"Cannot set attribute '{attr}' on non-class object {obj}")
+            if type(obj) is list:
+                changing(obj)
 
             obj[attr] = value
             return value
@@ -748,18 +1063,26 @@ class Interpreter(Tokenizer, Parser):
             lst = self.execute(list_expr, scope)
             idx = self.execute(index_expr, scope)
             if not isinstance(lst, (list, str, dict)):
+                if type(lst) is DiskDict or type(lst) is ListView or is_table(lst):
+                    return lst[idx]
+                if is_array(lst):
+                    from numeric import scalar
+                    return scalar(lst[idx])
                 raise TypeError("Indexing only supported on lists and strings")
             return lst[idx]
         
         if kind == 'slice':
             _, list_expr, start_expr, stop_expr, step_expr = node
             lst = self.execute(list_expr, scope)
-            if not isinstance(lst, (list, str)):
+            if not isinstance(lst, (list, str, ListView)) and not is_array(lst):
                 raise TypeError("Slicing only supported on lists and strings")
 
             start = self.execute(start_expr, scope) if start_expr else None
             stop = self.execute(stop_expr, scope) if stop_expr else None
             step = self.execute(step_expr, scope) if step_expr else None
+            if isinstance(lst, LISTS):
+                # Long slices of lists share the list instead of copying it, see views.py
+                return view(lst, slice(start, stop, step))
             return lst[start:stop:step]
 
         if kind == 'block':
@@ -784,7 +1107,17 @@ class Interpreter(Tokenizer, Parser):
                 step = 1
 
             if not isinstance(iterable, list):
-                raise TypeError("Expected list for 'for' loop iterable")
+                if isinstance(iterable, (Iterator, DiskDict, ListView)) or is_table(iterable):
+                    # Iterators like regex.finditer's (and a diskdict's keys, a table's rows, a slice) are gone over as they go, without making a list first
+                    return self.execute_lazy_for(var_name, iter(iterable), step, body, scope)
+                if type(iterable) in COLLECTIONS:
+                    # Sets, deques, heaps (smallest first) and counters (their keys) are looped over as a list of what's in them
+                    iterable = list(iterable)
+                elif not is_array(iterable):
+                    raise TypeError("Expected list for 'for' loop iterable")
+                else:
+                    # Arrays are looped over one plain number at a time, like a list
+                    iterable = iterable.tolist()
             
             for i in range(0, len(iterable), step):
                 local = scope
@@ -828,6 +1161,8 @@ class Interpreter(Tokenizer, Parser):
             try:
                 return self.execute_block(try_block, scope)
             except Exception as e:
+                if self.stats is not None:
+                    self.stats.caught += 1
                 new_scope = scope
                 new_scope[err_name] = str(e)
                 return self.execute_block(catch_block, new_scope)
@@ -850,63 +1185,32 @@ class Interpreter(Tokenizer, Parser):
                 }
                 # Attach methods to class
                 for method in methods:
-                    _, mname, mparams, mbody = method
-                    self.classs[qual_name]['__methods__'][mname] = Function(mparams, mbody, self.global_scope)
+                    _, mname, mparams, mbody, mtypes = method
+                    self.classs[qual_name]['__methods__'][mname] = Function(mparams, mbody, self.global_scope, mtypes)
                 # Recursively register nested classes
                 for nested in nested_classes:
                     n_name, n_parents, n_fields, n_methods, n_nested = nested[1], nested[2], nested[3], nested[4], nested[5] if len(nested) == 6 else []
                     register_class(n_name, n_parents, n_fields, n_methods, n_nested, qual_name)
             register_class(name, parents, fields, methods, nested_classes)
             nested_map = self._build_nested_map(name, nested_classes)
-            def conclassor(args, _):
-                instance = {'__type__': name}
-                for i, (field_name, default_expr) in enumerate(fields):
-                    if i < len(args):
-                        instance[field_name] = args[i]
-                    elif default_expr is not None:
-                        val = self.execute_with_nested_map(default_expr, self.global_scope, nested_map)
-                        instance[field_name] = val
-                    else:
-                        instance[field_name] = None
-                return instance
-            self.global_scope[name] = conclassor
+            self.global_scope[name] = Constructor(name, fields, nested_map)
             return None
 
         # Foriegn Function Interface (FFI)
         if kind == 'ffi':
             _, code = node
-            exec_env = {}
-
-            # We overwritten these functions in the global scope above, so it doesn't know what to do
-            # We temporarily give the functions back to Python since we're executing Python
-            exec_env.update({
-                'print': lambda *args: print(*args),
-                'range': range,
-                'input': input,
-                'int': int,
-                'float': float,
-                'str': str,
-                'list': list,
-                'dict': dict,
-                'chr': chr,
-                'ord': ord,
-                'map': map,
-                'filter': filter
-            })
-
-            # Inject vars outside of the FFI block
-            for key, val in scope.items():
-                if not callable(val):
-                    exec_env[key] = val
-
-            c = code.split(";")
-            for i in c:
-                exec(i.lstrip(), {}, exec_env)
-
-            # Pull any new variables back into interpreter scope
-            for k, v in exec_env.items():
-                if not callable(v):  # avoid overwriting builtins
-                    scope[k] = v
+            if self.stats is not None:
+                self.stats.ffi += 1
+            # Compiled once per block, the source is the cache key
+            compiled = FFI_CODE.get(code)
+            if self.stats is not None:
+                self.stats.cache('ffi', compiled is not None)
+            if compiled is None:
+                compiled = FFI_CODE[code] = compile(code, '<ffi>', 'exec')
+            if OUTPUT.parts:
+                OUTPUT.flush()
+            # Python's own print, range and so on come from the builtins, the nebula ones are hidden by the view
+            exec(compiled, {}, FFIScope(scope))
 
             return None
         
@@ -945,14 +1249,22 @@ class Interpreter(Tokenizer, Parser):
             _, params, body = node
             return Function(params, body, scope.copy())
 
+        if kind == 'await':
+            return self.event_loop().wait(self.execute(node[1], scope))
+
         if kind == 'getitem':
             _, obj_expr, index_expr = node
             obj = self.execute(obj_expr, scope)
             index = self.execute(index_expr, scope)
             try:
-                return obj[index]
+                value = obj[index]
             except (IndexError, KeyError, TypeError):
                 raise RuntimeError(f"Cannot index into object: {obj} with key {index}")
+            if not isinstance(obj, (list, dict, str)) and is_array(obj):
+                # A position gives back a plain number, a mask or a list of positions gives back an array
+                from numeric import scalar
+                return scalar(value)
+            return value
         raise RuntimeError(f"Unknown node: {node}")
     
     def eval_expr(self, code):
@@ -964,6 +1276,121 @@ class Interpreter(Tokenizer, Parser):
         else:
             return self.execute_block(ast, self.global_scope)
 
+    def get_attribute(self, obj, attr):
+        """obj.attr the way a script sees it: class methods and fields, nebula's own methods, then Python's for Python objects."""
+
+        # class method resolution (user-defined)
+        def find_in_class_chain(class_type, attr):
+            checked = set()
+            def search(cls):
+                if cls in checked or cls not in self.classs:
+                    return None
+                checked.add(cls)
+                class_info = self.classs[cls]
+                methods = class_info.get('__methods__', {})
+                method_key_options = [attr, f'{cls}.{attr}', f'self.{attr}']
+                for method_key in method_key_options:
+                    if method_key in methods:
+                        return methods[method_key]
+                # Check for field (fix: check field names, not tuples)
+                if any(field_name == attr for field_name, _ in class_info.get('fields', [])):
+                    return 'field'
+                # Search parents
+                for parent in class_info.get('parents', []):
+                    found = search(parent)
+                    if found:
+                        return found
+                return None
+            return search(class_type)
+        
+        # Native objects (files, actors...) keep the Python object under their type name
+        if isinstance(obj, dict) and obj.get('__type__') in self.native_methods:
+            methods = self.native_methods[obj['__type__']]
+            if attr in methods:
+                native = obj[obj['__type__']]
+                def bound_native_method(args, _):
+                    return methods[attr](native, *args)
+                return bound_native_method
+
+        if isinstance(obj, dict) and '__type__' in obj:
+            class_type = obj['__type__']
+            found = find_in_class_chain(class_type, attr)
+
+            if callable(found):
+                def bound_method(args, interpreter):
+                    return found([obj] + args, interpreter)
+                return bound_method
+            
+            if found == 'field':
+                return obj.get(attr, None)
+            
+            # List available fields and methods for better error
+            available = list(obj.keys())
+            # Add all methods from class chain
+
+            def collect_methods(cls, acc):
+                if cls not in self.classs:
+                    return
+                class_info = self.classs[cls]
+                acc.update(class_info.get('__methods__', {}).keys())
+                for parent in class_info.get('parents', []):
+                    collect_methods(parent, acc)
+
+            method_set = set()
+            collect_methods(class_type, method_set)
+            available += list(method_set)
+
+            raise AttributeError(f"Object of type '{class_type}' has no attribute '{attr}'. Available: {available}")
+
+        # Built-in string method resolution
+        if isinstance(obj, str) and attr in self.string_methods:
+            def bound_str_method(args, _):
+                return self.string_methods[attr](obj, *args)
+            return bound_str_method
+        
+        # Methods that change a slice that's a view change its own copy
+        if type(obj) is ListView and attr in self.list_methods and attr != 'index':
+            obj = obj.own()
+
+        # Built-in list method resolution
+        if isinstance(obj, LISTS) and attr in self.list_methods:
+            def bound_str_method(args, _):
+                return self.list_methods[attr](obj, *args)
+            return bound_str_method
+
+        # set, deque, heap, counter, strbuf, regex matches and diskdict
+        methods = self.collection_methods.get(type(obj))
+        if methods is not None and attr in methods:
+            def bound_collection_method(args, _):
+                return methods[attr](obj, *args)
+            return bound_collection_method
+        
+        # Modules from pyimport and what their functions give back have their Python attributes too
+        if self.python_object(obj):
+            try:
+                return attribute(obj.fn if type(obj) is PyCallable else obj, attr)
+            except AttributeError:
+                raise AttributeError(f"Object has no attribute '{attr}'")
+
+        # Native attribute access for dicts or objects
+        try:
+            return obj[attr]
+        except (TypeError, KeyError):
+            raise AttributeError(f"Object has no attribute '{attr}'")
+
+    def python_object(self, obj):
+        """Whether obj came from Python rather than being one of nebula's own values, builtins and functions."""
+        if type(obj) is PyCallable:
+            return True
+        return not (type(obj) in NEBULA_TYPES or type(obj) in self.collection_methods or callable(obj))
+
+    def include_path(self, filename):
+        """Where `include "filename"` finds its file: next to the script running, or else as it's written."""
+        included_path = os.path.normpath(os.path.join(os.path.dirname(sys.argv[1]), filename))
+        if not os.path.exists(included_path):
+            included_path = os.path.normpath(filename)
+        return included_path
+
     def include_module(self, args, _):
         filename = args[0]
         if not filename.endswith('.fn'):
@@ -977,12 +1404,11 @@ class Interpreter(Tokenizer, Parser):
             else:
                 raise FileNotFoundError(f"{filename[1:]} not found in {PATH}")
         try:
-            with open(filename, 'r') as f:
-                code = f.read()
+            ast = self.parse_file(filename)
         except FileNotFoundError:
             raise Exception(f"Included file '{filename}' not found")
-        tokens = self.tokenize(code)
-        ast = self.parse(tokens)
+        if self.stats is not None:
+            self.stats.includes += 1
         module_obj = {}
 
         # First pass: collect class and methods
@@ -1006,8 +1432,8 @@ class Interpreter(Tokenizer, Parser):
                     }
 
                     for method in methods:
-                        _, mname, mparams, mbody = method
-                        local_class[qual_name]['__methods__'][mname] = Function(mparams, mbody, self.global_scope)
+                        _, mname, mparams, mbody, mtypes = method
+                        local_class[qual_name]['__methods__'][mname] = Function(mparams, mbody, self.global_scope, mtypes)
 
                     for nested in nested_classes:
                         # Check if we have more nested classes
@@ -1019,31 +1445,19 @@ class Interpreter(Tokenizer, Parser):
                 nested_map = self._build_nested_map(name, nested_classes)
                 nested_maps[name] = nested_map
 
-                def mk_constructor(fields, class_name, nested_map):
-                    def constructor(args, _):
-                        instance = {'__type__': class_name}
-                        for i, (field_name, default_expr) in enumerate(fields):
-                            if i < len(args):
-                                instance[field_name] = args[i]
-                            elif default_expr is not None:
-                                val = self.execute_with_nested_map(default_expr, self.global_scope, nested_map)
-                                instance[field_name] = val
-                            else:
-                                instance[field_name] = None
-                        return instance
-                    return constructor
-                module_obj[name] = mk_constructor(fields, name, nested_map)
+                module_obj[name] = Constructor(name, fields, nested_map)
 
         # Second pass: collect functions and attach class methods
         for stmt in ast:
-            if isinstance(stmt, tuple) and stmt[0] == 'def':
-                _, name, params, body = stmt
+            if isinstance(stmt, tuple) and stmt[0] in ('def', 'asyncdef'):
+                _, name, params, body, types = stmt
+                kind = AsyncFunction if stmt[0] == 'asyncdef' else Function
                 if '.' in name:
                     class_name, method_name = name.split('.', 1)
                     if class_name in local_class:
-                        local_class[class_name]['__methods__'][method_name] = Function(params, body, self.global_scope)
+                        local_class[class_name]['__methods__'][method_name] = kind(params, body, self.global_scope, types)
                 else:
-                    module_obj[name] = Function(params, body, self.global_scope)
+                    module_obj[name] = kind(params, body, self.global_scope, types)
                     
         # Attach local_class to interpreter's self.classs
         for class_name, class_info in local_class.items():
@@ -1089,73 +1503,174 @@ class REPL:
     def repl(self):
         print(f"nebula version {VERSION}")
         interp = Interpreter()
-        buffer = []
+        # Lines are tokenized as they come in, so a long paste is only ever tokenized once
+        source = LineTokenizer(interp)
+        # ':time' or ':profile' while the statement they measure is being typed
+        measure = None
         PS1, PS2 = ">>> ", "... "
         prompt = PS1
 
         while True:
             try:
                 line = input(prompt)
-            except (EOFError, KeyboardInterrupt):
+            except EOFError:
                 print()
                 break
-
-            if not buffer and line.strip() in {"quit", "exit", ":q"}:
-                break
-            if not buffer and line.strip() == ":reset":
-                interp = Interpreter()
-                buffer.clear()
-                prompt = PS1
-                print("Interpreter reset.")
+            except KeyboardInterrupt:
+                print()
+                # Ctrl-C throws away a half typed statement, and quits from an empty prompt
+                if source.empty():
+                    break
+                source.clear()
+                measure, prompt = None, PS1
                 continue
 
-            buffer.append(line)
-            code = "\n".join(buffer)
+            if source.empty():
+                command, _, rest = line.strip().partition(' ')
+                if line.strip() in {"quit", "exit", ":q"}:
+                    break
+                if line.strip() == ":reset":
+                    interp = Interpreter()
+                    source = LineTokenizer(interp)
+                    print("Interpreter reset.")
+                    continue
+                if command in (':time', ':profile'):
+                    measure, line = command, rest
 
-            if self.needs_more(code, interp):
+            source.feed(line)
+            # An empty line runs whatever has been typed, even if the parser wants more
+            if source.needs_more() and line.strip():
                 prompt = PS2
                 continue
 
             try:
-                result = interp.run(code)
+                ast = interp.parse(source.tokens, '<stdin>')
+            except SyntaxError as e:
+                if str(e) == "Unexpected EOF" and line.strip():
+                    prompt = PS2
+                    continue
+                print(f"Error: {e}")
+                source.clear()
+                measure, prompt = None, PS1
+                continue
+
+            # The profilers look source lines up by file name
+            code = source.code()
+            linecache.cache['<stdin>'] = (len(code), None, code.splitlines(True), '<stdin>')
+            try:
+                if measure is None:
+                    result = interp.execute_block(ast, interp.global_scope)
+                else:
+                    result = self.measure(interp, ast, measure == ':profile')
+                OUTPUT.flush()
                 if result is not None:
                     print(result)
             except Exception as e:
+                OUTPUT.flush()
                 print(f"Error: {e}")
             finally:
-                buffer.clear()
-                prompt = PS1
-
-    def needs_more(self, code, interp):
-        """Checks if we want to continue the block inside the REPL"""
-        open_braces = code.count('{') - code.count('}')
-        open_parens = code.count('(') - code.count(')')
-        open_brackets = code.count('[') - code.count(']')
-
-        # Unmatched brackets
-        if open_braces > 0 or open_parens > 0 or open_brackets > 0:
-            return True
-
-        # Unterminated quotes
-        if code.count('"') % 2 != 0 or code.count("'") % 2 != 0:
-            return True
-
-        # Try to tokenize and parse to check completeness
+                source.clear()
+                measure, prompt = None, PS1
+
+    def measure(self, interp, ast, profile):
+        """Runs ast for :time (wall time, nodes and allocations) or :profile (which also says where they went)."""
+        from stats import Stats
+        tools = [Stats(interp)]
+        if profile:
+            from profiler import Sampler
+            from memstats import MemStats
+            tools += [Sampler(interp, interval=0.001), MemStats(interp)]
+        blocks = sys.getallocatedblocks()
+        for tool in tools:
+            tool.start()
+        start = time.perf_counter()
         try:
-            tokens = interp.tokenize(code)
-            interp.parse(tokens)
-            return False
-        except Exception:
-            # If parser can't parse yet (not enough lines), its probably incomplete
-            return False
-
-def main():
-    with open(sys.argv[1], 'r') as f:
-        code = f.read()
-    Interpreter().run(code)
+            return interp.execute_block(ast, interp.global_scope)
+        finally:
+            elapsed = time.perf_counter() - start
+            for tool in reversed(tools):
+                tool.stop()
+            OUTPUT.flush()
+            stats = tools[0]
+            print(f"time: {elapsed * 1000:.3f}ms, {sum(stats.nodes.values())} nodes, {stats.calls} calls, "
+                  f"{stats.builtin_calls} builtin calls, {sys.getallocatedblocks() - blocks:+} blocks allocated")
+            if profile:
+                print("nodes:", ', '.join(f"{kind} {count}" for kind, count in stats.nodes.most_common(10)))
+                for tool in tools[1:]:
+                    tool.report(out=sys.stdout)
+
+def parse_flags(argv):
+    """Pulls --flag and --flag=value options out from in front of the script, so __argv looks the same to scripts."""
+    flags = {}
+    while len(argv) > 1 and argv[1].startswith('--'):
+        key, _, value = argv.pop(1)[2:].partition('=')
+        flags[key] = value or True
+    return flags
+
+def main(flags={}, interp=None):
+    # The serve daemon passes in an interpreter it built ahead of time
+    interp = interp or Interpreter()
+
+    # Diagnostic tools all start before the script and report once it's done, even if it crashed
+    tools = []
+    # --profile samples which lines are running, --profile=out.folded also saves the stacks for a flamegraph
+    if 'profile' in flags:
+        from profiler import Sampler
+        collapsed = flags['profile'] if flags['profile'] is not True else None
+        tools.append(Sampler(interp, interval=float(flags.get('profile-interval', 5)) / 1000, collapsed=collapsed))
+    # --memstats tracks which lines and functions allocate the memory
+    if 'memstats' in flags:
+        from memstats import MemStats
+        tools.append(MemStats(interp))
+    # --stats counts what the interpreter did and dumps it as JSON, --stats=out.json writes it to a file
+    if 'stats' in flags:
+        from stats import Stats
+        tools.append(Stats(interp, flags['stats'] if flags['stats'] is not True else None))
+    # --vectorize-report says which list comprehensions ran on whole arrays and why the others didn't
+    if 'vectorize-report' in flags:
+        from vectorize import Report
+        tools.append(Report(interp))
+    # --fuel=nodes, --cpu=seconds and --mem=MiB put the script on a budget, see quota.py
+    if {'fuel', 'cpu', 'mem'} & flags.keys():
+        from quota import Quota
+        tools.append(Quota(interp, fuel=int(flags['fuel']) if 'fuel' in flags else None,
+                           cpu=float(flags['cpu']) if 'cpu' in flags else None,
+                           memory=int(float(flags['mem']) * 2**20) if 'mem' in flags else None))
+
+    # --snapshot=app.img runs the definitions at the top of the script and saves them for --image, nothing else
+    if 'snapshot' in flags:
+        from image import snapshot
+        snapshot(interp, sys.argv[1], flags['snapshot'])
+        return
+
+    for tool in tools:
+        tool.start()
+    try:
+        if 'image' in flags:
+            # --image=app.img starts from the saved definitions, making the image again if it's missing or out of date
+            from image import snapshot, restore
+            rest = restore(interp, flags['image'], sys.argv[1])
+            if rest is None:
+                rest = snapshot(interp, sys.argv[1], flags['image'])
+            try:
+                interp.execute_block(rest, interp.global_scope)
+            finally:
+                OUTPUT.flush()
+                sync_all(interp)
+        else:
+            interp.run_file(sys.argv[1])
+    finally:
+        for tool in reversed(tools):
+            tool.stop()
+            tool.report()
 
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
+    flags = parse_flags(sys.argv)
+    # --serve[=socket] keeps warm interpreters around for client.py
+    if 'serve' in flags:
+        from serve import serve
+        serve(flags['serve'] if flags['serve'] is not True else None)
+    elif len(sys.argv) < 2:
         r = REPL().repl()
     else:
-        main()
\ No newline at end of file
+        main(flags)
\ No newline at end of file
@@ -0,0 +1,151 @@
+import sys, tracemalloc, linecache
+sys.dont_write_bytecode = True
+from collections import Counter
+from views import ListView
+from profiler import callee_name
+
+class MemStats:
+    """Attributes memory to the nebula lines and functions that allocated it.
+
+    While running, the interpreter's `execute` is swapped for a wrapper that reads tracemalloc's
+    counters around every statement (parser.Node). Whatever a statement leaves allocated, minus what
+    its nested statements already accounted for, is charged to its line and to the function it runs in.
+    """
+
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.lines = Counter()
+        self.functions = Counter()
+        self.calls = ['<module>']
+        self.children = []
+        self.peak = 0
+        self.peak_at = None
+
+    def start(self):
+        tracemalloc.start()
+        self._execute = self.interpreter.execute
+        self.interpreter.execute = self.execute
+        self.interpreter.memstats = self
+
+    def stop(self):
+        self.current, self.peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.interpreter.execute = self._execute
+        self.interpreter.memstats = None
+
+    def execute(self, node, scope):
+        line = getattr(node, 'line', None)
+        is_call = node[0] == 'call'
+        if line is None and not is_call:
+            return self._execute(node, scope)
+
+        # Calls only tell us which function we're in, statements do the accounting
+        if is_call:
+            self.calls.append(callee_name(node[1]))
+        if line is None:
+            try:
+                return self._execute(node, scope)
+            finally:
+                self.calls.pop()
+
+        before = tracemalloc.get_traced_memory()[0]
+        self.children.append(0)
+        try:
+            return self._execute(node, scope)
+        finally:
+            after, peak = tracemalloc.get_traced_memory()
+            nested = self.children.pop()
+            if is_call:
+                self.calls.pop()
+            delta = after - before
+            if self.children:
+                self.children[-1] += delta
+            where = (node.file or '<stdin>', line)
+            self.lines[where] += delta - nested
+            self.functions[self.calls[-1]] += delta - nested
+            # Innermost statements finish first, so they get the credit for a new peak
+            if peak > self.peak:
+                self.peak, self.peak_at = peak, where
+
+    def report(self, out=sys.stderr, limit=10):
+        """Prints where the memory went."""
+        print(f"nebula memstats: {fmt_size(self.current)} retained, {fmt_size(self.peak)} peak", end='', file=out)
+        print(f" (reached at {self.peak_at[0]}:{self.peak_at[1]})" if self.peak_at else '', file=out)
+        # Temporaries a nested statement made and its parent freed show up as negative on the parent, skip those
+        print("retained by line:", file=out)
+        for (filename, line), size in self.lines.most_common(limit):
+            if size <= 0:
+                break
+            source = linecache.getline(filename, line).strip()
+            print(f"{fmt_size(size):>10}  {filename}:{line}  {source}", file=out)
+        print("retained by function:", file=out)
+        for name, size in self.functions.most_common(limit):
+            if size <= 0:
+                break
+            print(f"{fmt_size(size):>10}  {name}", file=out)
+        print("objects:", file=out)
+        for kind, count in count_objects(self.interpreter).items():
+            print(f"{count:>10}  {kind}", file=out)
+
+def fmt_size(size):
+    for unit in ('B', 'KiB', 'MiB'):
+        if abs(size) < 1024:
+            return f"{size:.0f}{unit}" if unit == 'B' else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GiB"
+
+def count_objects(interpreter):
+    """Counts live nebula values by kind: lists, dicts, instances of each class and function closures.
+
+    Everything reachable from the globals, the class registry and the scopes of whatever is currently running is counted once.
+    """
+    counts = Counter()
+    # Namespaces of builtins like regex aren't values the script made
+    seen = {id(value) for value in interpreter.builtins.values() if isinstance(value, dict)}
+    execute_code = type(interpreter).execute.__code__
+    todo = [interpreter.global_scope]
+    for info in interpreter.classs.values():
+        if isinstance(info, dict):
+            todo.extend(info.get('__methods__', {}).values())
+    # Local scopes only live on the Python stack
+    frame = sys._getframe()
+    while frame is not None:
+        if frame.f_code is execute_code:
+            todo.append(frame.f_locals.get('scope'))
+        frame = frame.f_back
+    scopes = {id(scope) for scope in todo if isinstance(scope, dict)}
+
+    while todo:
+        value = todo.pop()
+        if not isinstance(value, (list, dict, ListView)) and not hasattr(value, 'body'):
+            continue
+        if id(value) in seen:
+            continue
+        seen.add(id(value))
+        if isinstance(value, list):
+            counts['list'] += 1
+            todo.extend(value)
+        elif type(value) is ListView:
+            # What a view has in it is counted with the list it looks at
+            counts['list view'] += 1
+            todo.append(value.base)
+        elif isinstance(value, dict):
+            # Scopes are where values live, not values themselves
+            if id(value) not in scopes:
+                counts[f"instance {value['__type__']}" if '__type__' in value else 'dict'] += 1
+            todo.extend(value.values())
+        else:
+            counts['function'] += 1
+            scopes.add(id(value.scope))
+            todo.append(value.scope)
+    return dict(counts.most_common())
+
+def snapshot(interpreter):
+    """What the __memstats() builtin returns: memory figures while --memstats is on, object counts always."""
+    stats = {'objects': count_objects(interpreter)}
+    tracker = interpreter.memstats
+    if tracker is not None:
+        stats['current'], stats['peak'] = tracemalloc.get_traced_memory()
+        stats['lines'] = {f"{filename}:{line}": size for (filename, line), size in tracker.lines.most_common(10) if size > 0}
+        stats['functions'] = {name: size for name, size in tracker.functions.most_common(10) if size > 0}
+    return stats
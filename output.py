@@ -0,0 +1,75 @@
+"""Buffered output for print and printf.
+
+Whatever a script prints piles up in one buffer that's written out in a single go once it's big
+enough, when the script calls flush(), and whenever something else is about to write or read
+(input, ffi blocks, Python code, the script ending). On a terminal a newline flushes too, so the
+output still shows up a line at a time there.
+"""
+import sys, os, codecs, atexit
+sys.dont_write_bytecode = True
+
+# Characters the buffer holds before it's written out
+LIMIT = 1 << 16
+# printf's sep and end strings with their escapes decoded, by the string as written
+ESCAPES = {}
+
+class Output:
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+        # Where the buffer goes, sys.stdout when the first write into the buffer happened
+        self.stream = None
+        self.tty = False
+
+    def write(self, text):
+        if sys.stdout is not self.stream:
+            self.attach()
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= LIMIT or (self.tty and '\n' in text):
+            self.flush()
+
+    def attach(self):
+        # sys.stdout was swapped (tests and benchmarks capture it), what's buffered belongs to the old one
+        self.flush()
+        self.stream = sys.stdout
+        try:
+            self.tty = self.stream.isatty()
+        except (AttributeError, ValueError):
+            self.tty = False
+
+    def flush(self):
+        text = ''.join(self.parts)
+        self.parts.clear()
+        self.size = 0
+        if self.stream is None:
+            return
+        try:
+            if text:
+                self.stream.write(text)
+            self.stream.flush()
+        except ValueError:
+            # Written to after it was closed, like a captured stdout at exit
+            pass
+
+    def forget(self):
+        # A forked child starts with a copy of the buffer, which the parent writes out itself
+        self.parts.clear()
+        self.size = 0
+        self.stream = None
+
+OUTPUT = Output()
+atexit.register(OUTPUT.flush)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=OUTPUT.flush, after_in_child=OUTPUT.forget)
+
+def unescape(text):
+    """text with escapes like \\n decoded, worked out once per distinct string."""
+    decoded = ESCAPES.get(text)
+    if decoded is None:
+        # Only strings with a backslash need decoding, which also keeps other characters out of unicode_escape's latin-1
+        decoded = ESCAPES[text] = codecs.decode(text, 'unicode_escape') if '\\' in text else text
+    return decoded
+
+def fmt(value):
+    return value if isinstance(value, str) else repr(value)
@@ -0,0 +1,116 @@
+"""Data parallel map and filter over a pool of worker processes that each keep their own interpreter."""
+import sys, os, pickle, hashlib, itertools, multiprocessing
+sys.dont_write_bytecode = True
+from multiprocessing import shared_memory
+from output import OUTPUT
+from diskdict import sync_all
+
+# Below this many items starting up the chunks costs more than it saves
+SERIAL_THRESHOLD = 64
+
+_pool = None
+_pool_size = 0
+# Numbers each call's shared memory, so two calls running at once (from threads) never share a block
+_calls = itertools.count()
+
+# Worker side: the interpreter made when the worker started, and the last function it was sent (by its hash)
+_worker = None
+_loaded = (None, None)
+
+def pmap(args, interpreter, keep=False):
+    """pmap(fn, iterable, workers=cores, chunksize=auto), or pfilter with keep=True.
+
+    The interpreter binds workers and chunksize by name (pmap is wrapped in main.Keywords), a missing one is None.
+    """
+    fn, iterable = args[0], list(args[1])
+    workers = args[2] if len(args) > 2 and args[2] is not None else os.cpu_count() or 1
+    chunksize = args[3] if len(args) > 3 and args[3] is not None else max(1, -(-len(iterable) // (workers * 4)))
+    if chunksize < 1:
+        raise ValueError("chunksize has to be at least 1")
+
+    # Builtins can't be shipped to another process, and pool workers can't start pools of their own
+    serial = (workers <= 1 or len(iterable) < SERIAL_THRESHOLD or not hasattr(fn, 'body')
+              or multiprocessing.current_process().daemon)
+    if not serial:
+        try:
+            payload = pickle.dumps((fn, interpreter.classs))
+        except (pickle.PicklingError, TypeError, AttributeError):
+            serial = True
+    if serial:
+        if keep:
+            return [x for x in iterable if fn([x], interpreter)]
+        return [fn([x], interpreter) for x in iterable]
+
+    # The function (and the scope it carries, often the whole global scope) goes over once in shared
+    # memory, each chunk only says where. Its hash goes along, so workers know one they already loaded
+    name = f"nebula-pmap-{os.getpid()}-{next(_calls)}"
+    digest = hashlib.sha1(payload).hexdigest()
+    shm = shared_memory.SharedMemory(name=name, create=True, size=len(payload))
+    try:
+        shm.buf[:len(payload)] = payload
+        chunks = [((name, len(payload), digest), iterable[i:i + chunksize], keep) for i in range(0, len(iterable), chunksize)]
+        results = []
+        for chunk in get_pool(interpreter, workers).map(run_chunk, chunks):
+            results.extend(chunk)
+        return results
+    finally:
+        shm.close()
+        shm.unlink()
+
+def get_pool(interpreter, workers):
+    # The pool is made once and kept, so its workers only set up an interpreter the first time
+    global _pool, _pool_size
+    if _pool is None or _pool_size != workers:
+        if _pool is not None:
+            _pool.terminate()
+        _pool = multiprocessing.get_context('fork').Pool(workers, initializer=init_worker, initargs=(type(interpreter),))
+        _pool_size = workers
+    return _pool
+
+def init_worker(interpreter_class):
+    global _worker
+    sys.setrecursionlimit(10000)
+    _worker = interpreter_class()
+
+def run_chunk(task):
+    where, chunk, keep = task
+    fn = load(*where)
+    try:
+        if keep:
+            return [x for x in chunk if fn([x], _worker)]
+        return [fn([x], _worker) for x in chunk]
+    finally:
+        # Workers never exit normally, so whatever the function printed (or put in a diskdict) goes out with its chunk
+        OUTPUT.flush()
+        sync_all()
+
+def load(name, size, digest):
+    # Every chunk of one call has the same hash (and so does calling again with the same function), only read it once
+    global _loaded
+    if _loaded[0] != digest:
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            payload = bytes(shm.buf[:size])
+        finally:
+            shm.close()
+        fn, classes = pickle.loads(payload)
+        _worker.classs.update(classes)
+        adopt(fn, _worker.global_scope)
+        for info in classes.values():
+            for method in info.get('__methods__', {}).values():
+                adopt(method, _worker.global_scope)
+        _loaded = (digest, fn)
+    return _loaded[1]
+
+def adopt(fn, global_scope, seen=None):
+    """Gives a shipped function (and the functions it can reach) this worker's builtins back."""
+    seen = seen if seen is not None else set()
+    if id(fn) in seen:
+        return
+    seen.add(id(fn))
+    for name, value in global_scope.items():
+        if callable(value) and not hasattr(value, 'body') and not hasattr(value, 'fields'):
+            fn.scope.setdefault(name, value)
+    for value in list(fn.scope.values()):
+        if hasattr(value, 'body'):
+            adopt(value, global_scope, seen)
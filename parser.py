@@ -1,5 +1,11 @@
 import sys
 sys.dont_write_bytecode = True
+
+class Node(tuple):
+    """A statement node that also remembers which file and line it was parsed from."""
+    file = None
+    line = None
+
 class Parser:
     """Turns tokens into expressions."""
 
@@ -15,6 +21,12 @@ class Parser:
         self.pos += 1
         return token
 
+    def attribute(self):
+        # Keywords are fine as attribute names after a '.', like regex.match
+        if self.current()[0] == 'KEYWORD':
+            return self.eat('KEYWORD')[1]
+        return self.eat('IDENT')[1]
+
     def peek(self, n=1):
         # Looks at the next token without eating it
         pos = self.pos + n
@@ -22,9 +34,15 @@ class Parser:
             return (None, None)
         return self.tokens[pos]
     
-    def parse(self, tokens):
+    def parse(self, tokens, filename=None):
         self.tokens = tokens
         self.pos = 0
+        # Line numbers come from the tokenizer, the filename from whoever read the source
+        self.lines = getattr(tokens, 'lines', ())
+        self.types = getattr(tokens, 'types', {})
+        # The annotations of the function being parsed, None outside of one
+        self.declared = None
+        self.filename = filename
         x = self.parse_block(until=None)
         return x
 
@@ -32,6 +50,14 @@ class Parser:
         _, val = self.current()
         if val == 'def':
             return self.parse_function()
+        if val == 'async':
+            self.eat('KEYWORD', 'async')
+            if self.current()[1] != 'def':
+                raise SyntaxError(f"Expected def after async, got {self.current()}")
+            _, name, params, body, types = self.parse_function()
+            return ('asyncdef', name, params, body, types)
+        if val == 'import' and self.peek() == ('IDENT', 'py'):
+            return self.parse_pyimport()
         if val == 'if':
             return self.parse_if()
         if val == 'for':
@@ -75,11 +101,24 @@ class Parser:
             _, val = self.current()
             if until and val == until:
                 break
+            line = self.lines[self.pos] if self.pos < len(self.lines) else None
             stmt = self.parse_statement()
-            stmts.append(stmt)
+            stmts.append(self.locate(stmt, line))
 
         return stmts
 
+    def locate(self, node, line):
+        # Attach the source position to a statement so the profiler can point back at it
+        if line is None or not isinstance(node, tuple):
+            return node
+        node = Node(node)
+        node.file, node.line = self.filename, line
+        return node
+
+    def annotation(self):
+        # The type written after the token just eaten, e.g. the int in x :: <int>
+        return self.types.get(self.pos - 1)
+
     def parse_function(self):
         self.eat('KEYWORD')
 
@@ -102,6 +141,8 @@ class Parser:
         # Parse arguments
         self.eat('SYMBOL', '(')
 
+        # Annotated parameters, locals and the return type ('return') by name, see infer.py
+        types = {}
         params = []
         while self.current()[1] != ')':
             # Check for optional positional and keyword arguments e.g. *args, **kwargs
@@ -116,6 +157,8 @@ class Parser:
             else:
             # check for optional positional arguments e.g. x=1, y=2
                 _, ident = self.eat('IDENT')
+                if self.annotation():
+                    types[ident] = self.annotation()
                 default_expr = None
                 if self.current()[1] == '=':
                     self.eat('OP', '=')
@@ -126,16 +169,22 @@ class Parser:
                 self.eat('SYMBOL', ',')
 
         self.eat('SYMBOL', ')')
+        if self.annotation():
+            types['return'] = self.annotation()
 
         # Find the function body
         self.eat('SYMBOL', '{')
-        body = self.parse_block(until='}')
+        outer, self.declared = self.declared, types
+        try:
+            body = self.parse_block(until='}')
+        finally:
+            self.declared = outer
         self.eat('SYMBOL', '}')
 
         if is_method:
             params = ['self'] + params
 
-        return ('def', name, params, body)
+        return ('def', name, params, body, types)
     
     def parse_if(self):
         self.eat('KEYWORD', 'if')
@@ -288,7 +337,7 @@ class Parser:
             elif tok[1] == '.':
                 self.eat('SYMBOL', '.')
                 next_tok = self.current()
-                if next_tok[0] != 'IDENT':
+                if next_tok[0] not in ('IDENT', 'KEYWORD'):
                     # Combine e.g. 0 . 1 into float
                     if node[0] == 'num' and next_tok[0] == 'NUMBER':
                         self.eat('NUMBER')
@@ -297,7 +346,7 @@ class Parser:
                         continue  # Keep going until we whittle down the float expression 
                     else:
                         raise SyntaxError("Attribute access must be followed by an ident")
-                _, attr = self.eat('IDENT')
+                attr = self.attribute()
                 node = ('getattr', node, attr)
 
 
@@ -322,12 +371,13 @@ class Parser:
             return ('str', val)
         if kind == 'IDENT':
             name = self.eat('IDENT')[1]
+            annotated = self.annotation()
             node = ('var', name)
 
             # Handle field access (e.g. x.a.b.c...)
             while self.current() == ('SYMBOL', '.'):
                 self.eat('SYMBOL', '.')
-                attr = self.eat('IDENT')[1]
+                attr = self.attribute()
                 node = ('getattr', node, attr)
 
             while self.current() == ('SYMBOL', '['):
@@ -365,6 +415,8 @@ class Parser:
                 if node[0] == 'getitem':
                     return ('setindex', node[1], node[2], expr)
                 elif node[0] == 'var':
+                    if annotated and self.declared is not None:
+                        self.declared[name] = annotated
                     return ('assign', node[1], expr)
                 elif node[0] == 'getattr':
                     return ('setattr', node[1], node[2], expr)
@@ -513,6 +565,11 @@ class Parser:
             return ('list', items)
 
 
+        # Await binds tighter than any operator so `await f(x) + 1` awaits just the call
+        if val == 'await':
+            self.eat('KEYWORD', 'await')
+            return ('await', self.parse_expression(min_prec=100))
+
         # Match/Case
         if val == 'match':
             return self.parse_match()
@@ -573,7 +630,12 @@ class Parser:
             self.eat('SYMBOL', ')')
 
             self.eat('SYMBOL', '{')
-            body = self.parse_block(until='}')
+            # Lambdas have no annotations of their own, so anything inside one is left out of the function around it
+            outer, self.declared = self.declared, None
+            try:
+                body = self.parse_block(until='}')
+            finally:
+                self.declared = outer
             self.eat('SYMBOL', '}')
 
             return ('lambda', params, body)
@@ -657,6 +719,17 @@ class Parser:
 
         return ('try', err_name, try_block, catch_block)
     
+    def parse_pyimport(self):
+        # import py "module" as name is just name = pyimport("module")
+        self.eat('IDENT', 'import')
+        self.eat('IDENT', 'py')
+        module = self.eat('STRING')[1]
+        name = module.split('.')[-1]
+        if self.current() == ('IDENT', 'as'):
+            self.eat('IDENT', 'as')
+            name = self.eat('IDENT')[1]
+        return ('assign', name, ('call', ('var', 'pyimport'), [('str', module)], {}))
+
     def parse_ffi(self):
         self.eat('KEYWORD', 'ffi')
         self.eat('SYMBOL', '{')
@@ -672,7 +745,10 @@ class Parser:
                     self.eat('SYMBOL', '}')
                     break
 
-            if tok[0] == 'STRING':
+            # Statements end at a ; token, so a ; inside a string stays where it is
+            if tok == ('SYMBOL', ';'):
+                raw_code = raw_code.rstrip() + '\n'
+            elif tok[0] == 'STRING':
                 raw_code += repr(tok[1]) + ' '
             else:
                 raw_code += tok[1] + ' '
@@ -1,12 +1,21 @@
-import re, sys 
+import re, sys
 sys.dont_write_bytecode = True
 
+class Tokens(list):
+    """A list of (kind, value) tokens that also remembers which source line each token came from.
+
+    Type annotations aren't tokens of their own, `types` maps the position of the token an
+    annotation was written after to the type's name, so `x :: <int>` gives {position of x: 'int'}.
+    """
+    lines = ()
+    types = {}
+
 class Tokenizer:
     """Splits the source code into tokens using regular expressions."""
     def tokenize(self, code):
-        # Immediately get rid of comments
+        # Immediately get rid of comments, but keep their newlines so line numbers still line up
         code = re.sub(r'//.*', '', code)
-        code = re.sub(r'/\*.*?\*/', '', code, flags=re.DOTALL)
+        code = re.sub(r'/\*.*?\*/', lambda m: '\n' * m.group().count('\n'), code, flags=re.DOTALL)
         token_spec = [
             (r'\+\+|\+=|-=|\*=|/=|%=', 'AUG_ASSIGN'),
             (r'==|!=|<=|>=|<|>', 'COMPARE'),
@@ -14,19 +23,101 @@ class Tokenizer:
             (r'"[^"]*"|\'[^\']*\'', 'STRING'),
             (r'::\s*<[^>]+>', 'TYPEANN'),
             (r'\d+', 'NUMBER'),
-            (r'\b\bin\b|def\b|\bif\b|\belse\b|\belif\b|\bor\b|\band\b|\bnot\b|\bfor\b|\bwhile\b|\bbreak\b|\bcontinue\b|\breturn\b|\bglobal\b|\btry\b|\bcatch\b|\bthrow\b|\bclass\b|\bffi\b|\bmatch\b|\bcase\b|\blambda\b', 'KEYWORD'),
+            (r'\b\bin\b|def\b|\bif\b|\belse\b|\belif\b|\bor\b|\band\b|\bnot\b|\bfor\b|\bwhile\b|\bbreak\b|\bcontinue\b|\breturn\b|\bglobal\b|\btry\b|\bcatch\b|\bthrow\b|\bclass\b|\bffi\b|\bmatch\b|\bcase\b|\blambda\b|\basync\b|\bawait\b', 'KEYWORD'),
             (r'[A-Za-z_]\w*', 'IDENT'),
             (r'[;\|?:{}\[\](),.]', 'SYMBOL'),
             (r'\s+', None),
         ]
-        
-        # Group each token into its name and value using pipe delim 
+
+        # Group each token into its name and value using pipe delim
         tok_regex = '|'.join(f'(?P<{name}>{regex})' for regex, name in token_spec if name)
-        # Turn these into (key, value) tuples
-        tokens = [(m.lastgroup, m.group().strip("'").strip('"')) for m in re.finditer(tok_regex, code)]
-        # Remove type annotations and return the result
+        # Turn these into (key, value) tuples, counting newlines as we go for the line numbers
+        tokens = Tokens()
+        lines = []
+        types = {}
+        line, last = 1, 0
+        for m in re.finditer(tok_regex, code):
+            # Type annotations belong to the token before them, the parser picks them up from there
+            if m.lastgroup == 'TYPEANN':
+                if tokens:
+                    types[len(tokens) - 1] = m.group()[2:].strip()[1:-1].strip()
+                continue
+            line += code.count('\n', last, m.start())
+            last = m.start()
+            tokens.append((m.lastgroup, m.group().strip("'").strip('"')))
+            lines.append(line)
+        tokens.lines = lines
+        tokens.types = types
+        return tokens
+
+
+
+# Brackets that keep a statement open until they're closed
+OPENING = {'{': 1, '(': 1, '[': 1, '}': -1, ')': -1, ']': -1}
+# A line ending in one of these carries on to the next, except for a postfix ++ which ends its statement
+CONTINUES = {'OP', 'COMPARE', 'AUG_ASSIGN'}
+
+class LineTokenizer:
+    """Tokenizes source one line at a time, for the REPL.
+
+    Each line is only tokenized once, tokens pile up until the brackets balance. A string or a
+    /* comment left open at the end of a line is the only thing tokenized again, together with
+    the next line.
+    """
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.clear()
+
+    def clear(self):
+        self.tokens = Tokens()
+        self.tokens.lines = []
+        self.tokens.types = {}
+        self.source = []
+        self.depth = 0
+        # The start of a line whose string or comment is still open, and the line it started on
+        self.carry = None
+        self.carry_line = 0
+
+    def empty(self):
+        return not self.source
+
+    def feed(self, line):
+        """Adds a line, tokenizing whatever in it is complete."""
+        self.source.append(line)
+        if self.carry is None:
+            self.carry_line = len(self.source)
+            text = line
+        else:
+            text = self.carry + '\n' + line
+        if unterminated(text):
+            self.carry = text
+            return
+        self.carry = None
+        new = self.tokenizer.tokenize(text)
+        offset = len(self.tokens)
+        for position, name in new.types.items():
+            self.tokens.types[offset + position] = name
+        self.tokens.extend(new)
+        self.tokens.lines.extend(line + self.carry_line - 1 for line in new.lines)
+        for kind, value in new:
+            if kind == 'SYMBOL' and value in OPENING:
+                self.depth += OPENING[value]
 
-        return [t for t in tokens if t[0] != 'TYPEANN']
+    def needs_more(self):
+        """Whether the statement can't be finished yet: a bracket, string or comment is open, or the last line ended on an operator."""
+        if self.carry is not None or self.depth > 0:
+            return True
+        return bool(self.tokens) and self.tokens[-1][0] in CONTINUES and self.tokens[-1] != ('AUG_ASSIGN', '++')
 
+    def code(self):
+        return '\n'.join(self.source)
 
-    
\ No newline at end of file
+def unterminated(code):
+    """Whether code ends inside a string or a /* comment, going by the same rules tokenize uses."""
+    code = re.sub(r'//.*', '', code)
+    code = re.sub(r'/\*.*?\*/', '', code, flags=re.DOTALL)
+    if '/*' in code:
+        return True
+    code = re.sub(r'"[^"]*"|\'[^\']*\'', '', code)
+    return '"' in code or "'" in code
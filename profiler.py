@@ -0,0 +1,105 @@
+import sys, os, time, signal, threading, linecache
+sys.dont_write_bytecode = True
+from collections import Counter
+
+def callee_name(expr):
+    # Name a call after what is being called e.g. fib, stack.push
+    if isinstance(expr, tuple) and expr[0] == 'var':
+        return expr[1]
+    if isinstance(expr, tuple) and expr[0] == 'getattr' and isinstance(expr[2], str):
+        return f"{callee_name(expr[1])}.{expr[2]}"
+    return '<lambda>'
+
+class Sampler:
+    """A statistical profiler that periodically looks at which nebula statement is running.
+
+    Nothing is added to the interpreter's hot path: every sample walks the Python stack of the
+    interpreter thread, picks out the `execute` frames and reads the node each one is working on.
+    Statement nodes carry their file and line (see parser.Node), calls give us the function names.
+    """
+
+    def __init__(self, interpreter, interval=0.005, mode=None, collapsed=None):
+        self.execute_code = type(interpreter).execute.__code__
+        self.interval = interval
+        self.collapsed = collapsed
+        # A profiling timer signal is the cheapest and counts CPU time, but only works on unix main threads
+        if mode is None:
+            mode = 'signal' if hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread() else 'thread'
+        self.mode = mode
+        self.lines = Counter()
+        self.stacks = Counter()
+        self.samples = 0
+        self.started = self.elapsed = 0
+
+    def start(self):
+        self.started = time.perf_counter()
+        if self.mode == 'signal':
+            signal.signal(signal.SIGPROF, lambda signum, frame: self.sample(frame))
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        else:
+            self.target = threading.get_ident()
+            self.running = True
+            self.thread = threading.Thread(target=self._loop, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        if self.mode == 'signal':
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+        else:
+            self.running = False
+            self.thread.join()
+        self.elapsed = time.perf_counter() - self.started
+
+    def _loop(self):
+        while self.running:
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(self.target)
+            if frame is not None:
+                self.sample(frame)
+
+    def sample(self, frame):
+        # Collect the nodes being executed, outermost first
+        nodes = []
+        while frame is not None:
+            if frame.f_code is self.execute_code:
+                node = frame.f_locals.get('node')
+                if isinstance(node, tuple):
+                    nodes.append(node)
+            frame = frame.f_back
+        if not nodes:
+            return
+        nodes.reverse()
+
+        # Every call node starts a new frame on the nebula stack, statements update its line
+        stack = [['<module>', None]]
+        where = None
+        for node in nodes:
+            if getattr(node, 'line', None) is not None:
+                where = (node.file or '<stdin>', node.line)
+                stack[-1][1] = where
+            if node[0] == 'call':
+                stack.append([callee_name(node[1]), None])
+
+        self.samples += 1
+        if where:
+            self.lines[where] += 1
+        self.stacks[';'.join(f"{name} ({loc[0]}:{loc[1]})" if loc else name for name, loc in stack)] += 1
+
+    def report(self, out=sys.stderr, limit=20):
+        """Prints the hottest source lines, and saves the stacks if we were asked to."""
+        if self.collapsed:
+            self.write_collapsed(self.collapsed)
+        print(f"nebula profile: {self.samples} samples over {self.elapsed:.2f}s ({self.interval * 1000:g}ms interval, {self.mode})", file=out)
+        if not self.samples:
+            return
+        print(f"{'pct':>7} {'samples':>8}  location", file=out)
+        for (filename, line), count in self.lines.most_common(limit):
+            source = linecache.getline(filename, line).strip()
+            print(f"{count / self.samples:7.1%} {count:8}  {filename}:{line}  {source}", file=out)
+
+    def write_collapsed(self, path):
+        """Writes the stacks in the collapsed format flamegraph.pl and speedscope understand."""
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
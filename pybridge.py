@@ -0,0 +1,75 @@
+"""Python modules as nebula values: pyimport, `import py "module" as name` and plugins."""
+import sys, os, types, importlib
+sys.dont_write_bytecode = True
+
+# What a method call runs, looked up in the class: plain functions and the methods of built in types
+METHODS = (types.FunctionType, types.MethodDescriptorType, types.WrapperDescriptorType)
+
+# (type, name): the PyCallable of the function obj.name(...) runs with obj first, or None when obj.name isn't a plain method.
+# Types and modules stay around as long as the process anyway, so neither of these holds on to anything extra
+_methods = {}
+# (module, name): the PyCallable module.name was last handed out as
+_functions = {}
+
+class PyCallable:
+    """A Python function, class or method living in nebula.
+
+    The interpreter calls the function underneath directly with the real positional and keyword
+    arguments, so nothing gets made per call. Everything else that calls builtins, like map or
+    reduce, goes through __call__ with nebula's (args, interpreter).
+    """
+    __slots__ = ('fn',)
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    def __call__(self, args, interpreter):
+        return py_value(self.fn(*args))
+
+    def __repr__(self):
+        return f"<python {getattr(self.fn, '__qualname__', type(self.fn).__name__)}>"
+
+def py_value(value):
+    """What a Python value looks like in nebula: callables get marked, everything else is used as it is."""
+    return PyCallable(value) if callable(value) else value
+
+def method(obj, name):
+    """The wrapped function obj.name(...) calls with obj first, the same one for every object of its type.
+
+    None when obj.name is anything but a method defined by obj's class (a property, something set on
+    obj itself, a module's function), which then has to be looked up on obj.
+    """
+    key = (type(obj), name)
+    found = _methods.get(key, False)
+    if found is False:
+        found = None
+        for klass in type(obj).__mro__:
+            if name in klass.__dict__:
+                if isinstance(klass.__dict__[name], METHODS):
+                    found = PyCallable(klass.__dict__[name])
+                break
+        _methods[key] = found
+    if found is not None and name in getattr(obj, '__dict__', ()):
+        return None
+    return found
+
+def attribute(obj, name):
+    """obj.name for a Python object. A module's functions get one wrapper each, not a new one every time they're looked up."""
+    value = getattr(obj, name)
+    if not isinstance(obj, types.ModuleType) or not callable(value):
+        return py_value(value)
+    key = (obj, name)
+    wrapped = _functions.get(key)
+    if wrapped is None or wrapped.fn is not value:
+        wrapped = _functions[key] = PyCallable(value)
+    return wrapped
+
+def pyimport(args, _):
+    """pyimport(name) gives back the Python module called name."""
+    return importlib.import_module(args[0])
+
+def load_plugins(interpreter):
+    """Runs register(interpreter) from every module named in NEBULA_PLUGINS (a comma separated list)."""
+    for name in os.environ.get('NEBULA_PLUGINS', '').split(','):
+        if name.strip():
+            importlib.import_module(name.strip()).register(interpreter)
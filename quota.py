@@ -0,0 +1,233 @@
+"""Fuel, CPU and memory quotas for scripts, and a scheduler that time-slices many of them in one process."""
+import sys, time, threading, tracemalloc
+sys.dont_write_bytecode = True
+from collections import deque
+
+# How many nodes run between quota checks (and between turns when scheduled)
+SLICE = 1000
+# Nodes a script still gets after a QuotaExceeded, so its catch block can clean up
+GRACE = 10000
+
+# Quotas with a memory limit running right now, tracemalloc is only stopped once the last one is done
+_tracing = 0
+# Whether those quotas started tracemalloc, and so get to stop it (--memstats may have started it first)
+_started = False
+_tracing_lock = threading.Lock()
+
+def trace():
+    global _tracing, _started
+    with _tracing_lock:
+        if _tracing == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started = True
+        _tracing += 1
+
+def untrace():
+    global _tracing, _started
+    with _tracing_lock:
+        _tracing -= 1
+        if _tracing == 0 and _started:
+            tracemalloc.stop()
+            _started = False
+
+class QuotaExceeded(Exception):
+    """Raised the first time a script runs out of fuel, CPU time or memory. nebula's try can catch it."""
+
+class QuotaKilled(BaseException):
+    """Raised once the grace after a QuotaExceeded is used up too. Not an Exception, so nothing can catch it."""
+
+class Quota:
+    """Meters one interpreter: fuel is counted per node, CPU time and memory every SLICE nodes.
+
+    Like the other tools it swaps the interpreter's `execute` for a wrapper, so nothing is paid
+    without a quota. `turn` is called at the end of every slice, it's how the Scheduler takes the
+    script off the CPU and lets the next one run.
+    """
+
+    def __init__(self, interpreter, fuel=None, cpu=None, memory=None, slice=SLICE, turn=None):
+        self.interpreter = interpreter
+        self.limits = {'fuel': fuel, 'cpu': cpu, 'memory': memory}
+        # A fuel limit below one slice still has to be noticed
+        self.slice = min(slice, fuel) if fuel else slice
+        self.turn = turn
+        self.used = {'fuel': 0, 'cpu': 0.0, 'memory': 0}
+        self.exceeded = None
+        self.left = self.slice
+        self.traced = False
+
+    def start(self):
+        self._execute = self.interpreter.execute
+        self.interpreter.execute = self.execute
+        self.interpreter.quota = self
+        if self.limits['memory'] is not None:
+            # Scheduled scripts share the one tracemalloc, so it's counted rather than stopped by whoever finishes first
+            trace()
+            self.traced = True
+        self.begin()
+
+    def stop(self):
+        self.end()
+        self.interpreter.execute = self._execute
+        self.interpreter.quota = None
+        if self.traced:
+            untrace()
+            self.traced = False
+
+    def execute(self, node, scope):
+        self.left -= 1
+        if self.left <= 0:
+            self.refuel()
+        return self._execute(node, scope)
+
+    def begin(self):
+        """Starts a slice: remembers where the CPU clock and the traced memory were."""
+        self.left = self.slice
+        self.cpu_mark = time.thread_time()
+        self.memory_mark = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+    def end(self):
+        """Ends a slice: adds what it used to the totals."""
+        self.used['fuel'] += self.slice - self.left
+        self.used['cpu'] += time.thread_time() - self.cpu_mark
+        if tracemalloc.is_tracing():
+            self.used['memory'] += tracemalloc.get_traced_memory()[0] - self.memory_mark
+
+    def refuel(self):
+        self.end()
+        if self.turn is not None:
+            self.turn()
+        self.begin()
+        self.check()
+
+    def as_dict(self):
+        used = dict(self.used, fuel=self.used['fuel'] + self.slice - self.left)
+        return {'used': used, 'limits': dict(self.limits), 'exceeded': self.exceeded}
+
+    def check(self):
+        for name, limit in self.limits.items():
+            if limit is None or self.used[name] < limit:
+                continue
+            if self.exceeded is None:
+                # Give the script a little more of everything to run its catch block with
+                self.exceeded = name
+                self.limits = {k: v if v is None else self.used[k] + (GRACE if k == 'fuel' else v * 0.1) for k, v in self.limits.items()}
+                raise QuotaExceeded(f"{name} quota exceeded ({self.describe(name)})")
+            raise QuotaKilled(f"{name} quota exceeded again after {self.exceeded} ran out, script stopped")
+
+    def describe(self, name):
+        value = self.used[name]
+        if name == 'cpu':
+            return f"{value:.2f}s of CPU"
+        if name == 'memory':
+            return f"{value / 2**20:.1f}MiB allocated"
+        return f"{value} nodes"
+
+    def report(self, out=sys.stderr):
+        if self.exceeded is not None:
+            print(f"quota: {self.describe('fuel')}, {self.describe('cpu')}, {self.describe('memory')}", file=out)
+
+class Task:
+    """One script in a Scheduler, running on a thread of its own whenever the scheduler gives it a turn."""
+    def __init__(self, scheduler, interpreter, code, filename, **limits):
+        self.scheduler = scheduler
+        self.interpreter = interpreter
+        self.code = code
+        self.filename = filename
+        self.quota = Quota(interpreter, slice=scheduler.slice, turn=self.pause, **limits)
+        self.go = threading.Event()
+        self.finished = False
+        self.status = 'waiting'
+        self.result = None
+
+    def pause(self):
+        """Hands the CPU back to the scheduler and waits for the next turn."""
+        self.scheduler.back.set()
+        self.go.wait()
+        self.go.clear()
+
+    def main(self):
+        self.go.wait()
+        self.go.clear()
+        self.status = 'running'
+        self.quota.start()
+        try:
+            self.result = self.interpreter.run(self.code, self.filename)
+            self.status = 'ok'
+        except QuotaKilled as e:
+            self.status = f'killed: {e}'
+        except QuotaExceeded as e:
+            self.status = f'stopped: {e}'
+        except Exception as e:
+            self.status = f'error: {type(e).__name__}: {e}'
+        finally:
+            self.quota.stop()
+            self.finished = True
+            self.scheduler.back.set()
+
+class Scheduler:
+    """Runs many interpreters in one process, round robin, one slice of nodes at a time.
+
+    Every script gets a thread, but only the one whose turn it is runs, so a runaway loop only
+    ever holds up the others for a single slice.
+    """
+
+    def __init__(self, slice=SLICE):
+        self.slice = slice
+        self.tasks = []
+        self.back = threading.Event()
+
+    def add(self, code, filename=None, interpreter=None, **limits):
+        """Queues a script, limits are the same fuel, cpu and memory a Quota takes."""
+        if interpreter is None:
+            from main import Interpreter
+            interpreter = Interpreter()
+        task = Task(self, interpreter, code, filename, **limits)
+        self.tasks.append(task)
+        return task
+
+    def run(self):
+        """Runs every queued script to the end and gives back their tasks."""
+        # The evaluator recurses deeply, so give the script threads room for it
+        size = threading.stack_size(64 * 2**20)
+        try:
+            for task in self.tasks:
+                threading.Thread(target=task.main, daemon=True).start()
+        finally:
+            threading.stack_size(size)
+        ready = deque(self.tasks)
+        while ready:
+            task = ready.popleft()
+            self.back.clear()
+            task.go.set()
+            self.back.wait()
+            if not task.finished:
+                ready.append(task)
+        return self.tasks
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Runs many nebula scripts in one process, taking turns.")
+    parser.add_argument('scripts', nargs='+')
+    parser.add_argument('--slice', type=int, default=SLICE, help="nodes a script runs before the next one gets a turn")
+    parser.add_argument('--fuel', type=int, help="nodes each script may run")
+    parser.add_argument('--cpu', type=float, help="CPU seconds each script may use")
+    parser.add_argument('--mem', type=float, help="MiB each script may allocate")
+    opts = parser.parse_args()
+
+    sys.setrecursionlimit(10000)
+    scheduler = Scheduler(opts.slice)
+    for script in opts.scripts:
+        with open(script, 'r') as f:
+            code = f.read()
+        task = scheduler.add(code, script, fuel=opts.fuel, cpu=opts.cpu,
+                             memory=int(opts.mem * 2**20) if opts.mem is not None else None)
+        task.interpreter.global_scope['__argv'] = ['main.py', script]
+        task.interpreter.global_scope['__argc'] = 2
+    failed = 0
+    for task in scheduler.run():
+        print(f"{task.filename}: {task.status}", file=sys.stderr)
+        failed += task.status != 'ok'
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""Reading and writing JSON Lines and CSV one record at a time.
+
+The readers give back an iterator, so a for loop over one only ever holds the record it's on and
+memory stays the same however big the file is. Records come out as plain lists and dicts, parsed
+by Python's json and csv modules instead of split() and character loops in nebula. Anywhere a file
+goes, a path works too: the reader or writer opens it and closes it again once it's done.
+"""
+import sys, json, csv
+sys.dont_write_bytecode = True
+from itertools import chain
+from output import unescape
+from views import ListView
+
+def opened(source, mode):
+    """(file, whether it was opened here) for a path or a nebula file object."""
+    if isinstance(source, str):
+        return open(source, mode, newline='', encoding='utf-8'), True
+    if isinstance(source, dict) and source.get('__type__') == '__file__':
+        return source['__file__'], False
+    raise TypeError(f"expected a path or a file, not {type(source).__name__}")
+
+def lines_of(source):
+    f, owned = opened(source, 'r')
+    try:
+        yield from f
+    finally:
+        if owned:
+            f.close()
+
+def jsonl_read(args, _):
+    """jsonl_read(file) goes over the JSON value on each line of file, skipping blank lines."""
+    loads = json.loads
+    return (loads(line) for line in lines_of(args[0]) if not line.isspace())
+
+def boolean(text):
+    lowered = text.strip().lower()
+    if lowered in ('true', '1', 'yes'):
+        return True
+    if lowered in ('false', '0', 'no'):
+        return False
+    raise ValueError(f"can't read {text!r} as a bool")
+
+def typed(convert):
+    # An empty field is a missing value whatever the column's type
+    def column(text):
+        return convert(text) if text != '' else None
+    return column
+
+# What csv_read's types can ask for, and what turns a field into it
+CONVERTERS = {'str': str, 'int': typed(int), 'float': typed(float), 'bool': typed(boolean)}
+
+def converter(kind):
+    if kind not in CONVERTERS:
+        raise ValueError(f"column types have to be one of {list(CONVERTERS)}, got {kind!r}")
+    return CONVERTERS[kind]
+
+def csv_read(args, _):
+    """csv_read(file, types={}, header=True, sep=",") goes over the rows of a CSV file.
+
+    With a header each row is a dict by column name, without one a list. types says what a column
+    holds by its name (or position without a header): "int", "float", "bool" or "str", the default.
+    """
+    source = args[0]
+    types = args[1] if len(args) > 1 and args[1] is not None else {}
+    header = args[2] if len(args) > 2 else True
+    # Escapes like \t are decoded the same way printf does
+    sep = unescape(args[3]) if len(args) > 3 else ','
+    return rows(source, types, header, sep)
+
+def rows(source, types, header, sep):
+    f, owned = opened(source, 'r')
+    try:
+        reader = csv.reader(f, delimiter=sep)
+        names = next(reader, None) if header else None
+        if header and names is None:
+            return
+        pending = []
+        if names is None:
+            # Without a header the first row says how many columns there are
+            first = next(reader, None)
+            if first is None:
+                return
+            pending.append(first)
+            columns = range(len(first))
+        else:
+            columns = names
+        for column in types:
+            if column not in columns:
+                raise ValueError(f"there's no column {column!r} to give a type")
+        # Only the columns that aren't strings need anything done to them, in place in the row csv made
+        converted = [(i, converter(types[column])) for i, column in enumerate(columns)
+                     if column in types and types[column] != 'str']
+        for row in chain(pending, reader):
+            for i, convert in converted:
+                row[i] = convert(row[i])
+            yield dict(zip(names, row)) if names is not None else row
+    finally:
+        if owned:
+            f.close()
+
+def views_as_lists(value):
+    if type(value) is ListView:
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} can't be written as JSON")
+
+def jsonl_write(args, _):
+    """jsonl_write(file, records) writes each record as a line of JSON, giving back how many there were."""
+    target, records = args
+    f, owned = opened(target, 'w')
+    count = 0
+    dumps = json.dumps
+    try:
+        for record in records:
+            # Slices that are views go out as the lists they are
+            f.write(dumps(record, default=views_as_lists))
+            f.write('\n')
+            count += 1
+    finally:
+        if owned:
+            f.close()
+    return count
+
+def csv_write(args, _):
+    """csv_write(file, records, columns=None, sep=",") writes records as CSV rows, giving back how many there were.
+
+    Dicts are written under a header of columns (the first record's keys if there are none given),
+    lists are written as they are.
+    """
+    target, records = args[:2]
+    columns = args[2] if len(args) > 2 else None
+    sep = unescape(args[3]) if len(args) > 3 else ','
+    f, owned = opened(target, 'w')
+    count = 0
+    try:
+        writer = csv.writer(f, delimiter=sep, lineterminator='\n')
+        for record in records:
+            if isinstance(record, dict):
+                if columns is None:
+                    columns = list(record)
+                if count == 0:
+                    writer.writerow(columns)
+                writer.writerow([record.get(column) for column in columns])
+            else:
+                writer.writerow(record)
+            count += 1
+    finally:
+        if owned:
+            f.close()
+    return count
@@ -0,0 +1,83 @@
+"""regex: regular expressions, so scanning text runs in Python's re instead of a character loop.
+
+Every function takes the pattern as a string and compiles it through a small LRU cache, so calling
+them over and over in a loop with the same few patterns only compiles each one once. Matches are
+Python's match objects, with the methods in Interpreter.match_methods.
+"""
+import sys, re
+sys.dont_write_bytecode = True
+from collections import OrderedDict
+
+# How many compiled patterns are kept, the least recently used goes first
+SIZE = 128
+
+# pattern: compiled pattern, least recently used first
+_patterns = OrderedDict()
+
+def compiled(pattern, interpreter):
+    found = _patterns.get(pattern)
+    hit = found is not None
+    if hit:
+        _patterns.move_to_end(pattern)
+    else:
+        if not isinstance(pattern, str):
+            raise TypeError(f"a pattern has to be a string, not {type(pattern).__name__}")
+        try:
+            found = _patterns[pattern] = re.compile(pattern)
+        except re.error as e:
+            raise ValueError(f"bad pattern {pattern!r}: {e}") from None
+        if len(_patterns) > SIZE:
+            _patterns.popitem(last=False)
+    if interpreter.stats is not None:
+        interpreter.stats.cache('regex', hit)
+    return found
+
+def match(args, interpreter):
+    """match(pattern, text) matches pattern at the start of text, giving back the match or None."""
+    pattern, text = args
+    return compiled(pattern, interpreter).match(text)
+
+def search(args, interpreter):
+    """search(pattern, text) finds the first place pattern matches in text, giving back the match or None."""
+    pattern, text = args
+    return compiled(pattern, interpreter).search(text)
+
+def fullmatch(args, interpreter):
+    """fullmatch(pattern, text) matches pattern against all of text, giving back the match or None."""
+    pattern, text = args
+    return compiled(pattern, interpreter).fullmatch(text)
+
+def findall(args, interpreter):
+    """findall(pattern, text) gives back every match as a string, or as a list of its groups if it has more than one."""
+    pattern, text = args
+    # Groups as lists, nebula has no tuples
+    return [list(found) if type(found) is tuple else found for found in compiled(pattern, interpreter).findall(text)]
+
+def finditer(args, interpreter):
+    """finditer(pattern, text) goes over the matches one at a time, only finding the next when it's asked for."""
+    pattern, text = args
+    return compiled(pattern, interpreter).finditer(text)
+
+def sub(args, interpreter):
+    """sub(pattern, replacement, text, count=0) replaces matches with a string (which can use \\1) or what a function gives for each match."""
+    pattern, replacement, text = args[:3]
+    count = args[3] if len(args) > 3 else 0
+    if not isinstance(replacement, str):
+        fn = replacement
+        replacement = lambda found: fn([found], interpreter)
+    return compiled(pattern, interpreter).sub(replacement, text, count)
+
+def split(args, interpreter):
+    """split(pattern, text, maxsplit=0) splits text wherever pattern matches."""
+    pattern, text = args[:2]
+    maxsplit = args[2] if len(args) > 2 else 0
+    return compiled(pattern, interpreter).split(text, maxsplit)
+
+def escape(args, _):
+    """escape(text) is text with everything that means something in a pattern escaped."""
+    return re.escape(args[0])
+
+# What regex.<name> gives back in nebula
+FUNCTIONS = {fn.__name__: fn for fn in (match, search, fullmatch, findall, finditer, sub, split, escape)}
+
+Match = re.Match
@@ -0,0 +1,145 @@
+"""
+runs the nebula test scripts in parallel and checks their output
+
+Every script under tests/ and examples/ (minus EXCLUDE) runs inside a pool of warm worker
+processes, one per core, each with nebula already imported. Whatever a script prints is compared
+against its snapshot in snapshots/, and each script gets a CPU time and a memory budget.
+
+    python3 runtests.py             run everything
+    python3 runtests.py tests/oop   run the scripts whose path starts with tests/oop
+    python3 runtests.py --update    write the current output as the new snapshots
+"""
+import sys, os, io, glob, time, signal, difflib, argparse, resource, traceback, contextlib, subprocess, multiprocessing
+sys.dont_write_bytecode = True
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SNAPSHOTS = os.path.join(ROOT, 'snapshots')
+import main as nebula
+
+# Same as the Makefile: these need input, a file argument or are broken
+EXCLUDE = ['tests/calc.fn', 'tests/file.fn', 'tests/e120.fn', 'examples/test.bf', 'examples/calc.fn', 'examples/stack.fn']
+# Extra arguments some scripts need in __argv
+ARGS = {'examples/bf.fn': ['examples/test.bf']}
+# Pool workers can't start processes of their own, so these get a fresh interpreter process each
+OWN_PROCESS = ['tests/actors.fn', 'tests/parallel.fn']
+
+class BudgetExceeded(BaseException):
+    """Raised inside a worker when a script runs out of CPU time. It isn't an Exception so nebula's try can't catch it."""
+
+def discover(prefixes=()):
+    scripts = sorted(glob.glob('tests/*') + glob.glob('examples/*'))
+    scripts = [s for s in scripts if os.path.isfile(s) and s not in EXCLUDE]
+    if prefixes:
+        scripts = [s for s in scripts if any(s.startswith(p) for p in prefixes)]
+    return scripts
+
+def snapshot_path(script):
+    return os.path.join(SNAPSHOTS, script + '.out')
+
+def vm_size():
+    # Bytes of address space this process already uses, so the memory budget only counts what the script adds
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[0]) * resource.getpagesize()
+
+def init_worker():
+    os.chdir(ROOT)
+    sys.setrecursionlimit(10000)
+    def out_of_time(signum, frame):
+        raise BudgetExceeded()
+    signal.signal(signal.SIGVTALRM, out_of_time)
+
+def run_test(job):
+    """Runs one script in this worker and returns (script, status, output, cpu seconds)."""
+    script, cpu_budget, mem_budget = job
+    if script in OWN_PROCESS:
+        return run_process(script, cpu_budget, mem_budget)
+    sys.argv = ['main.py', script] + ARGS.get(script, [])
+    sys.stdin = io.StringIO()
+    out = io.StringIO()
+
+    limits = resource.getrlimit(resource.RLIMIT_AS)
+    if mem_budget and os.path.exists('/proc/self/statm'):
+        resource.setrlimit(resource.RLIMIT_AS, (vm_size() + mem_budget, limits[1]))
+    signal.setitimer(signal.ITIMER_VIRTUAL, cpu_budget)
+    start = time.process_time()
+    status = 'ok'
+    try:
+        with open(script, 'r') as f:
+            code = f.read()
+        with contextlib.redirect_stdout(out):
+            nebula.Interpreter().run(code, script)
+    except BudgetExceeded:
+        status = f'over the {cpu_budget:g}s CPU budget'
+    except MemoryError:
+        status = f'over the {mem_budget // 2**20}MiB memory budget'
+    except Exception:
+        status = 'error'
+        out.write(traceback.format_exc())
+    finally:
+        signal.setitimer(signal.ITIMER_VIRTUAL, 0)
+        resource.setrlimit(resource.RLIMIT_AS, limits)
+    return script, status, out.getvalue(), time.process_time() - start
+
+def run_process(script, cpu_budget, mem_budget):
+    """Runs one script through main.py in a child process, with the budgets as resource limits."""
+    def limit():
+        resource.setrlimit(resource.RLIMIT_CPU, (int(cpu_budget) + 1, int(cpu_budget) + 1))
+        if mem_budget:
+            resource.setrlimit(resource.RLIMIT_AS, (vm_size() + mem_budget, resource.RLIM_INFINITY))
+    start = resource.getrusage(resource.RUSAGE_CHILDREN)
+    proc = subprocess.run([sys.executable, 'main.py', script] + ARGS.get(script, []), stdin=subprocess.DEVNULL,
+                          capture_output=True, text=True, preexec_fn=limit)
+    end = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = end.ru_utime + end.ru_stime - start.ru_utime - start.ru_stime
+    if proc.returncode == -signal.SIGXCPU:
+        return script, f'over the {cpu_budget:g}s CPU budget', proc.stdout, cpu
+    if proc.returncode != 0:
+        return script, 'error', proc.stdout + proc.stderr, cpu
+    return script, 'ok', proc.stdout, cpu
+
+def check(script, status, output, update):
+    """Compares the output with the snapshot and returns (passed, message)."""
+    if status != 'ok':
+        return False, status + ('\n' + output if status == 'error' else '')
+    path = snapshot_path(script)
+    if update:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(output)
+        return True, 'snapshot written'
+    if not os.path.exists(path):
+        # Otherwise a new or renamed script could never fail
+        return False, 'no snapshot, run with --update to write one'
+    with open(path, 'r') as f:
+        expected = f.read()
+    if output == expected:
+        return True, ''
+    diff = difflib.unified_diff(expected.splitlines(True), output.splitlines(True), 'expected', 'got')
+    return False, 'output differs from the snapshot\n' + ''.join(diff)
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the nebula test scripts.")
+    parser.add_argument('paths', nargs='*', help="only run scripts whose path starts with one of these")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="worker processes (default: one per core)")
+    parser.add_argument('--cpu', type=float, default=10, help="CPU seconds each script may use")
+    parser.add_argument('--mem', type=int, default=512, help="MiB of memory each script may allocate, 0 for no limit")
+    parser.add_argument('--update', action='store_true', help="write the current output as the new snapshots")
+    opts = parser.parse_args()
+
+    os.chdir(ROOT)
+    scripts = discover(opts.paths)
+    jobs = [(script, opts.cpu, opts.mem * 2**20) for script in scripts]
+    failed = []
+    start = time.perf_counter()
+    # Forked workers start with nebula imported and are reused for every script they get
+    with multiprocessing.get_context('fork').Pool(opts.jobs, initializer=init_worker) as pool:
+        for script, status, output, cpu in pool.imap_unordered(run_test, jobs):
+            passed, message = check(script, status, output, opts.update)
+            print(f"{'PASS' if passed else 'FAIL'} {script} ({cpu:.2f}s){' - ' + message if message else ''}")
+            if not passed:
+                failed.append(script)
+
+    print(f"\n{len(scripts) - len(failed)} passed, {len(failed)} failed in {time.perf_counter() - start:.2f}s")
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""The serve daemon: runs scripts for client.py in processes forked from a warm template."""
+import sys, os, gc, marshal, pickle, signal, socket, selectors, traceback
+sys.dont_write_bytecode = True
+import main as nebula
+from client import SOCKET, private
+from diskdict import sync_all
+
+def serve(path=None):
+    """Listens on the unix socket at path until killed.
+
+    The daemon imports everything and builds an Interpreter once, then forks a copy of itself for
+    every request, so a run only pays for the fork. Each child sends back the files it had to
+    parse, so the next forks start with them in their parse cache.
+    """
+    path = path or SOCKET
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    private(directory)
+    if os.path.exists(path):
+        os.unlink(path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Made owner only from the start, there's no moment where someone else could connect
+    umask = os.umask(0o177)
+    try:
+        listener.bind(path)
+    finally:
+        os.umask(umask)
+    listener.listen(64)
+    print(f"nebula serving on {path}", file=sys.stderr)
+
+    sys.setrecursionlimit(10000)
+    template = nebula.Interpreter()
+    # Everything made so far is shared with the children, keep the collector from touching (and copying) it
+    gc.freeze()
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    # Exit through the finally below so the socket file gets removed
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    selector = selectors.DefaultSelector()
+    selector.register(listener, selectors.EVENT_READ)
+    pending = {}
+    try:
+        while True:
+            for key, _ in selector.select():
+                if key.fileobj is listener:
+                    conn, _ = listener.accept()
+                    child, fd = fork(conn, listener, template)
+                    conn.close()
+                    pending[fd] = (child, [])
+                    selector.register(fd, selectors.EVENT_READ)
+                    continue
+                fd = key.fileobj
+                child, chunks = pending[fd]
+                data = os.read(fd, 1 << 16)
+                if data:
+                    chunks.append(data)
+                    continue
+                selector.unregister(fd)
+                os.close(fd)
+                os.waitpid(child, 0)
+                del pending[fd]
+                try:
+                    nebula.PARSED.update(pickle.loads(b''.join(chunks)))
+                except Exception:
+                    pass
+    finally:
+        listener.close()
+        os.unlink(path)
+
+def fork(conn, listener, template):
+    """Starts a child for one request, returns its pid and the pipe it sends its parse cache back on."""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    r, w = os.pipe()
+    child = os.fork()
+    if child:
+        os.close(w)
+        return child, r
+    os.close(r)
+    listener.close()
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # The client passes on Ctrl-C, which has to stop the script the way it would under main.py: as a KeyboardInterrupt
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    status = 1
+    try:
+        status = handle(conn, template, w)
+    finally:
+        os._exit(status)
+
+def handle(conn, interp, pipe):
+    """Runs the request on conn in this (forked) process and returns the exit status."""
+    data, fds, _, _ = socket.recv_fds(conn, 1 << 16, 3)
+    size = int.from_bytes(data[:4], 'little')
+    while len(data) < size + 4:
+        data += conn.recv(1 << 16)
+    request = marshal.loads(data[4:])
+    # The client's stdin, stdout and stderr become ours
+    for target, fd in enumerate(fds):
+        os.dup2(fd, target)
+        os.close(fd)
+    sys.stdout.reconfigure(line_buffering=os.isatty(1))
+    os.chdir(request['cwd'])
+    os.environ.clear()
+    os.environ.update(request['env'])
+    conn.sendall(os.getpid().to_bytes(8, 'little', signed=True))
+
+    # __argv is sys.argv itself, so change it in place
+    sys.argv[:] = request['argv']
+    known = set(nebula.PARSED)
+    status = 0
+    try:
+        flags = nebula.parse_flags(sys.argv)
+        interp.global_scope['__argc'] = len(sys.argv)
+        nebula.main(flags, interp)
+    except SystemExit as e:
+        status = e.code if isinstance(e.code, int) else (e.code is not None)
+    except KeyboardInterrupt:
+        traceback.print_exc()
+        # What a shell reports for a process stopped by SIGINT
+        status = 128 + signal.SIGINT
+    except BaseException:
+        traceback.print_exc()
+        status = 1
+    finally:
+        # A second Ctrl-C mustn't cut the flushing short
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        # The child leaves through os._exit, so nothing atexit would have written gets written
+        nebula.OUTPUT.flush()
+        sync_all()
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+    try:
+        conn.sendall(int(status).to_bytes(8, 'little', signed=True))
+    except OSError:
+        pass
+    parsed = {p: entry for p, entry in nebula.PARSED.items() if p not in known}
+    with os.fdopen(pipe, 'wb') as f:
+        try:
+            pickle.dump(parsed, f)
+        except Exception:
+            pass
+    return status
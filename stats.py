@@ -0,0 +1,60 @@
+import sys, json
+sys.dont_write_bytecode = True
+from collections import Counter
+
+class Stats:
+    """Runtime counters for the interpreter's hot paths, only collected with --stats.
+
+    Node evaluations are counted by swapping the interpreter's `execute` for a wrapper, everything
+    else is bumped by the interpreter itself behind an `if self.stats is not None` check, so
+    nothing is paid when the counters are off.
+    """
+
+    def __init__(self, interpreter, path=None):
+        self.interpreter = interpreter
+        self.path = path
+        self.nodes = Counter()
+        self.calls = 0
+        self.builtin_calls = 0
+        self.includes = 0
+        self.ffi = 0
+        self.caught = 0
+        self.caches = {}
+
+    def start(self):
+        self._execute = self.interpreter.execute
+        self.interpreter.execute = self.execute
+        self.interpreter.stats = self
+
+    def stop(self):
+        self.interpreter.execute = self._execute
+        self.interpreter.stats = None
+
+    def execute(self, node, scope):
+        self.nodes[node[0]] += 1
+        return self._execute(node, scope)
+
+    def cache(self, name, hit):
+        """Records a hit or a miss for one of the runtime's caches."""
+        counts = self.caches.setdefault(name, {'hits': 0, 'misses': 0})
+        counts['hits' if hit else 'misses'] += 1
+
+    def as_dict(self):
+        return {
+            'nodes': dict(self.nodes.most_common()),
+            'calls': self.calls,
+            'builtin_calls': self.builtin_calls,
+            'includes': self.includes,
+            'ffi': self.ffi,
+            'caught': self.caught,
+            'caches': {name: dict(counts) for name, counts in self.caches.items()},
+        }
+
+    def report(self, out=sys.stderr):
+        """Dumps the counters as JSON, to the --stats=file if one was given."""
+        if self.path:
+            with open(self.path, 'w') as f:
+                json.dump(self.as_dict(), f, indent=2)
+        else:
+            json.dump(self.as_dict(), out, indent=2)
+            print(file=out)
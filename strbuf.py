@@ -0,0 +1,73 @@
+"""strbuf: a string that grows in place, for building text a piece at a time.
+
+`s = s + piece` copies all of s every time, so building a string that way in a loop takes time
+that grows with the square of its length. A strbuf keeps the pieces and only joins them when the
+text is asked for, so appending a million pieces takes as long as joining them once.
+"""
+import sys
+sys.dont_write_bytecode = True
+
+class StrBuf:
+    __slots__ = ('parts', 'size')
+    __hash__ = None
+
+    def __init__(self, text=''):
+        self.parts = []
+        self.size = 0
+        if text:
+            self.append(text)
+
+    def append(self, piece):
+        if type(piece) is not str:
+            if not isinstance(piece, StrBuf):
+                raise TypeError(f"a strbuf only takes strings, not {type(piece).__name__}")
+            piece = piece.build()
+        self.parts.append(piece)
+        self.size += len(piece)
+        return self
+
+    def extend(self, pieces):
+        for piece in pieces:
+            self.append(piece)
+        return self
+
+    def build(self):
+        """The text so far. It's kept as the only piece, so building again (or after more appends) doesn't join it twice."""
+        if len(self.parts) > 1:
+            self.parts[:] = [''.join(self.parts)]
+        return self.parts[0] if self.parts else ''
+
+    def clear(self):
+        self.parts.clear()
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __str__(self):
+        return self.build()
+
+    def __repr__(self):
+        return f"strbuf({self.build()!r})"
+
+    def __eq__(self, other):
+        if isinstance(other, (str, StrBuf)):
+            return self.build() == str(other)
+        return NotImplemented
+
+    # + still gives a plain string, only += and append() add to the buffer itself
+    def __add__(self, other):
+        return self.build() + str(other) if isinstance(other, (str, StrBuf)) else NotImplemented
+
+    def __radd__(self, other):
+        return other + self.build() if isinstance(other, str) else NotImplemented
+
+def strbuf(args, _):
+    """strbuf(text="") makes a string builder, optionally starting with some text."""
+    return StrBuf(args[0] if args else '')
+
+def plus(a, b):
+    # += on a strbuf appends to it instead of making a new string
+    if type(a) is StrBuf:
+        return a.append(b)
+    return a + b
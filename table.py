@@ -0,0 +1,462 @@
+"""Columnar tables: records kept as one column each, filtered, grouped, sorted and joined a column at a time.
+
+Columns of ints, floats or bools are arrays from numeric.py (NumPy's when it's installed), any
+other column is a list. where() turns a predicate lambda made of comparisons, arithmetic,
+and/or/not and `in` on the row's fields into operations on whole columns. Any other predicate,
+or one that could come out different that way (a division by zero, ints too big for 64 bits),
+is called once per row instead, so the rows picked are always the ones calling it would pick.
+"""
+import sys
+sys.dont_write_bytecode = True
+from itertools import compress, repeat
+from numeric import numpy, ARRAYS, array
+from vectorize import ARITHMETIC, COMPARISONS, unwrap, boolean
+from records import csv_read, jsonl_read, csv_write, jsonl_write
+
+# Ints in an array stay below this, anything that could go past it is worked out a row at a time
+LIMIT = 2 ** 63
+
+# What group_by(...).agg() can do to a column
+AGGREGATES = ('sum', 'mean', 'min', 'max', 'count', 'first', 'last')
+
+class NotColumnar(Exception):
+    pass
+
+def column(values):
+    """A column holding values: an array when they're all ints, all floats or all bools, a list otherwise."""
+    if isinstance(values, ARRAYS):
+        return values
+    values = values if isinstance(values, list) else list(values)
+    kinds = set(map(type, values))
+    if len(kinds) == 1 and kinds <= {int, float, bool}:
+        try:
+            return array([values, {int: 'int', float: 'float', bool: 'bool'}[kinds.pop()]], None)
+        except OverflowError:
+            # Ints too big for 64 bits stay Python ints
+            pass
+    return values
+
+def values_of(col):
+    """The column as a list of plain nebula values."""
+    return col.tolist() if isinstance(col, ARRAYS) else col
+
+def kind_of(col):
+    if not isinstance(col, ARRAYS):
+        return None
+    kind = col.dtype.kind if numpy is not None else col.kind
+    return {'i': 'int', 'f': 'float', 'b': 'bool'}.get(kind, kind)
+
+def take(col, positions):
+    """The values at positions, in that order. A None position gives a None."""
+    if None in positions:
+        values = values_of(col)
+        return column([values[i] if i is not None else None for i in positions])
+    if isinstance(col, ARRAYS):
+        if numpy is not None:
+            return col[numpy.array(positions, dtype=numpy.int64)]
+        return col[positions]
+    return list(map(col.__getitem__, positions))
+
+def pick(col, mask):
+    """The values a bool mask picks out."""
+    if isinstance(col, ARRAYS):
+        return col[mask]
+    return list(compress(col, values_of(mask)))
+
+class Table:
+    """Rows of records stored as columns by name. Looping over one gives each row as a dict."""
+
+    def __init__(self, data, interpreter=None):
+        lengths = {len(col) for col in data.values()}
+        if len(lengths) > 1:
+            raise ValueError("every column of a table has to be as long as the others")
+        # name: column, in the order they were given
+        self.data = data
+        self.length = lengths.pop() if lengths else 0
+        self.interpreter = interpreter
+
+    def derived(self, data):
+        return Table(data, self.interpreter)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        names = list(self.data)
+        for values in zip(*map(values_of, self.data.values())):
+            yield dict(zip(names, values))
+
+    def __getitem__(self, name):
+        if name not in self.data:
+            raise KeyError(f"the table has no column {name!r}, it has {list(self.data)}")
+        return self.data[name]
+
+    def __repr__(self):
+        return f"table({ {name: values_of(col) for name, col in self.data.items()} })"
+
+    def columns(self):
+        """The names of the columns."""
+        return list(self.data)
+
+    def column(self, name):
+        """The column itself: an array for numbers and bools, otherwise a list."""
+        return self[name]
+
+    def rows(self):
+        """Every row as a dict."""
+        return list(self)
+
+    def head(self, n=5):
+        return self.derived({name: col[:n] for name, col in self.data.items()})
+
+    def names(self, names):
+        # Columns can be named one at a time or as a list
+        if len(names) == 1 and isinstance(names[0], list):
+            names = names[0]
+        for name in names:
+            if name not in self.data:
+                raise ValueError(f"the table has no column {name!r}, it has {list(self.data)}")
+        return list(names)
+
+    def select(self, *names):
+        """A table with just the named columns, in that order."""
+        return self.derived({name: self.data[name] for name in self.names(names)})
+
+    def where(self, predicate):
+        """A table with the rows predicate gives True for."""
+        mask = self.mask(predicate)
+        return self.derived({name: pick(col, mask) for name, col in self.data.items()})
+
+    def mask(self, predicate):
+        try:
+            is_column, result = Predicate(predicate, self).value_of()
+        except (NotColumnar, TypeError, ValueError, ZeroDivisionError, OverflowError):
+            interpreter = self.interpreter
+            if interpreter is not None and interpreter.stats is not None:
+                interpreter.stats.cache('where columnar', False)
+            return bools([bool(predicate([row], interpreter)) for row in self])
+        if self.interpreter is not None and self.interpreter.stats is not None:
+            self.interpreter.stats.cache('where columnar', True)
+        if is_column:
+            return as_mask((True, result))
+        # The predicate didn't look at the row at all
+        return bools([bool(result)] * self.length)
+
+    def sort_by(self, names, descending=False):
+        """A table with the rows in order of the named column (or of several, the first deciding first)."""
+        keys = self.keys(names)
+        order = sorted(range(self.length), key=keys.__getitem__, reverse=descending)
+        return self.derived({name: take(col, order) for name, col in self.data.items()})
+
+    def keys(self, names):
+        """Each row's value of names as a list, or its values of several names together."""
+        if isinstance(names, list):
+            return list(zip(*(values_of(self[name]) for name in names)))
+        return values_of(self[names])
+
+    def group_by(self, *names):
+        """The rows grouped by the named columns, to be put together with agg()."""
+        return Groups(self, self.names(names))
+
+    def join(self, other, on, how='inner'):
+        """Rows of this table next to the rows of other with the same values in the on column(s).
+
+        how="left" keeps the rows that have no match too, with None for the other table's columns.
+        Columns of other that have the same name as one here get "_right" on the end.
+        """
+        if not isinstance(other, Table):
+            raise TypeError(f"can only join a table with another table, not {type(other).__name__}")
+        if how not in ('inner', 'left'):
+            raise ValueError(f'how has to be "inner" or "left", got {how!r}')
+        index = {}
+        for j, key in enumerate(other.keys(on)):
+            index.setdefault(key, []).append(j)
+        left, right = [], []
+        for i, key in enumerate(self.keys(on)):
+            matches = index.get(key)
+            if matches:
+                left.extend(repeat(i, len(matches)))
+                right.extend(matches)
+            elif how == 'left':
+                left.append(i)
+                right.append(None)
+        data = {name: take(col, left) for name, col in self.data.items()}
+        shared = set(on) if isinstance(on, list) else {on}
+        for name, col in other.data.items():
+            if name not in shared:
+                data[name + '_right' if name in data else name] = take(col, right)
+        return self.derived(data)
+
+    def to_csv(self, file):
+        """Writes the table out as CSV, giving back how many rows there were."""
+        return csv_write([file, iter(self), list(self.data)], None)
+
+    def to_jsonl(self, file):
+        """Writes every row out as a line of JSON, giving back how many there were."""
+        return jsonl_write([file, iter(self)], None)
+
+class Groups:
+    """A table's rows grouped by the values of some of its columns."""
+
+    def __init__(self, table, names):
+        self.table = table
+        self.names = names
+        keys = table.keys(names if len(names) > 1 else names[0])
+        # The group number of every row, groups numbered in the order they first show up
+        index = {}
+        self.codes = [index.setdefault(key, len(index)) for key in keys]
+        self.groups = list(index)
+
+    def __repr__(self):
+        return f"<table grouped by {', '.join(self.names)}: {len(self.groups)} groups>"
+
+    def agg(self, spec):
+        """A table with a row per group: the group's values of the columns it was grouped by, then spec's aggregates.
+
+        spec says what to do to each column by its name: one of AGGREGATES, or a list of them,
+        which makes a column per aggregate named column_aggregate. "count" of a name that isn't a
+        column counts the rows in the group.
+        """
+        if not isinstance(spec, dict):
+            raise TypeError('agg takes a dict like {"amount": "sum"}')
+        data = {}
+        if len(self.names) == 1:
+            data[self.names[0]] = column(self.groups)
+        else:
+            for j, name in enumerate(self.names):
+                data[name] = column([key[j] for key in self.groups])
+        for name, hows in spec.items():
+            many = isinstance(hows, list)
+            for how in hows if many else [hows]:
+                if how not in AGGREGATES:
+                    raise ValueError(f"aggregates have to be one of {list(AGGREGATES)}, got {how!r}")
+                if how == 'count' and name not in self.table.data:
+                    values = None
+                else:
+                    values = values_of(self.table[name])
+                data[f"{name}_{how}" if many else name] = column(aggregate(how, self.codes, values, len(self.groups)))
+        return self.table.derived(data)
+
+def aggregate(how, codes, values, groups):
+    """how worked out over the values of each group, in one pass over the rows."""
+    if how == 'count':
+        counts = [0] * groups
+        for code in codes:
+            counts[code] += 1
+        return counts
+    if how in ('sum', 'mean'):
+        totals, counts = [0] * groups, [0] * groups
+        for code, value in zip(codes, values):
+            totals[code] += value
+            counts[code] += 1
+        return totals if how == 'sum' else [total / count for total, count in zip(totals, counts)]
+    result = [None] * groups
+    seen = [False] * groups
+    for code, value in zip(codes, values):
+        if not seen[code]:
+            result[code], seen[code] = value, True
+        elif how == 'last' or (how == 'min' and value < result[code]) or (how == 'max' and value > result[code]):
+            result[code] = value
+    return result
+
+class Predicate:
+    """A where() predicate worked out a whole column at a time.
+
+    Every value along the way is (whether it's a column, the value): a column holds one value
+    per row, anything else is the same for every row.
+    """
+
+    def __init__(self, fn, table):
+        params = getattr(fn, 'params', None)
+        body = getattr(fn, 'body', None)
+        if params is None or body is None or len(params) != 1 or len(body) != 1:
+            raise NotColumnar("not a lambda of one row")
+        param = params[0] if isinstance(params[0], str) else params[0][0]
+        if param.startswith('*'):
+            raise NotColumnar("takes its row as *args")
+        self.param = param
+        self.scope = fn.scope
+        self.table = table
+        self.body = body[0]
+
+    def value_of(self):
+        return self.value(self.body)
+
+    def field(self, node):
+        """The column name if node reads a field of the row, else None."""
+        kind = node[0]
+        if kind in ('getitem', 'index') and unwrap(node[1]) == ('var', self.param):
+            key = unwrap(node[2])
+            if key[0] == 'str':
+                return key[1]
+        if kind == 'getattr' and unwrap(node[1]) == ('var', self.param) and isinstance(node[2], str):
+            return node[2]
+        return None
+
+    def constant(self, node):
+        """The value of something that's the same for every row: literals and variables from outside."""
+        kind = node[0]
+        if kind in ('num', 'str'):
+            return node[1]
+        if kind == 'list':
+            return [self.constant(unwrap(item)) for item in node[1] or []]
+        if kind == 'var' and node[1] != self.param:
+            if node[1] not in self.scope:
+                raise NotColumnar(f"{node[1]} isn't defined")
+            value = self.scope[node[1]]
+            if isinstance(value, (int, float, str, type(None), list, set, dict)):
+                return value
+        raise NotColumnar(f"uses {kind}")
+
+    def value(self, node):
+        node = unwrap(node)
+        kind = node[0]
+        name = self.field(node)
+        if name is not None:
+            if name not in self.table.data:
+                raise NotColumnar(f"no column {name}")
+            return True, self.table.data[name]
+        if kind == 'binop' and node[1] in ARITHMETIC:
+            return arithmetic(node[1], self.value(node[2]), self.value(node[3]))
+        if kind == 'compare' and node[1] in COMPARISONS:
+            return compare(node[1], self.value(node[2]), self.value(node[3]))
+        if kind in ('and', 'or'):
+            # Only the same as & and | when both sides are True or False
+            if not (boolean(node[1]) and boolean(node[2])):
+                raise NotColumnar(f"'{kind}' between values that aren't True or False")
+            return logical(kind, self.value(node[1]), self.value(node[2]))
+        if kind == 'not':
+            if not boolean(node[1]):
+                raise NotColumnar("'not' of a value that isn't True or False")
+            return negate(self.value(node[1]))
+        if kind in ('in', 'nin'):
+            found = membership(self.value(node[1]), self.value(node[2]))
+            return negate(found) if kind == 'nin' else found
+        return False, self.constant(node)
+
+def bools(values):
+    return array([values, 'bool'], None)
+
+def spread(a, b):
+    """Both sides as things to go along row by row, repeating a side that's the same for every row."""
+    count = len(a[1]) if a[0] else len(b[1])
+    return [values_of(value) if is_column else repeat(value, count) for is_column, value in (a, b)]
+
+def by_row(fn, a, b):
+    # Element by element in Python, for lists and whatever arrays can't do
+    return True, column(list(map(fn, *spread(a, b))))
+
+def arithmetic(op, a, b):
+    fn = ARITHMETIC[op]
+    if not a[0] and not b[0]:
+        return False, fn(a[1], b[1])
+    for is_column, value in (a, b):
+        if is_column and not isinstance(value, ARRAYS) or type(value) not in (int, float) and not isinstance(value, ARRAYS):
+            return by_row(fn, a, b)
+        if isinstance(value, ARRAYS) and kind_of(value) == 'bool':
+            raise NotColumnar("arithmetic on a column of True and False")
+    if op in ('/', '%') and (0 in values_of(b[1]) if b[0] else b[1] == 0):
+        raise NotColumnar("might divide by zero")
+    if numpy is not None and op != '/' and 'float' not in (kind_of(a[1]), kind_of(b[1])) \
+            and not isinstance(a[1], float) and not isinstance(b[1], float):
+        # NumPy's ints wrap around where Python's would just get bigger
+        (alo, ahi), (blo, bhi) = bounds(a), bounds(b)
+        corners = [fn(x, y) for x in (alo, ahi) for y in (blo, bhi)] if op != '%' else [blo, bhi]
+        if max(abs(corner) for corner in corners) >= LIMIT:
+            raise NotColumnar("the ints could get too big")
+    return True, fn(a[1], b[1])
+
+def bounds(side):
+    is_column, value = side
+    if not is_column:
+        return value, value
+    if not len(value):
+        return 0, 0
+    return value.min().item(), value.max().item()
+
+def ordered(x, y):
+    # Ordering is only defined between numbers or between strings, like the interpreter's compare
+    numbers = (int, float)
+    return (isinstance(x, numbers) and isinstance(y, numbers)) or (isinstance(x, str) and isinstance(y, str))
+
+def compare(op, a, b):
+    fn = COMPARISONS[op]
+    if not a[0] and not b[0]:
+        if op not in ('==', '!=') and not ordered(a[1], b[1]):
+            raise NotColumnar("ordering between values that aren't both numbers or both strings")
+        return False, fn(a[1], b[1])
+    arrays = all(isinstance(value, ARRAYS) or (not is_column and type(value) in (int, float)) for is_column, value in (a, b))
+    if arrays and not (op not in ('==', '!=') and 'bool' in (kind_of(a[1]), kind_of(b[1]))):
+        return True, fn(a[1], b[1])
+    results = []
+    for x, y in zip(*spread(a, b)):
+        if op not in ('==', '!=') and not ordered(x, y):
+            raise NotColumnar("ordering between values that aren't both numbers or both strings")
+        results.append(fn(x, y))
+    return True, bools(results)
+
+def as_mask(side):
+    is_column, value = side
+    if not is_column or kind_of(value) == 'bool':
+        return value
+    return bools([bool(v) for v in values_of(value)])
+
+def logical(kind, a, b):
+    if not a[0] and not b[0]:
+        return False, (a[1] and b[1]) if kind == 'and' else (a[1] or b[1])
+    if not a[0] or not b[0]:
+        # One side is the same for every row, so it decides on its own or leaves it to the other
+        mask, flag = (as_mask(b), a[1]) if b[0] else (as_mask(a), b[1])
+        if kind == 'and':
+            return True, mask if flag else bools([False] * len(mask))
+        return True, bools([True] * len(mask)) if flag else mask
+    x, y = as_mask(a), as_mask(b)
+    if numpy is not None:
+        return True, numpy.logical_and(x, y) if kind == 'and' else numpy.logical_or(x, y)
+    return True, (x & y) if kind == 'and' else (x | y)
+
+def negate(side):
+    is_column, value = side
+    if not is_column:
+        return False, not value
+    mask = as_mask(side)
+    return True, numpy.logical_not(mask) if numpy is not None else ~mask
+
+def membership(item, container):
+    if not item[0] and not container[0]:
+        return False, item[1] in container[1]
+    return True, bools([x in y for x, y in zip(*spread(item, container))])
+
+def from_rows(rows, interpreter):
+    """A table out of dicts, with a column for every key any of them has (None where a row doesn't)."""
+    data = {}
+    count = 0
+    for row in rows:
+        if not isinstance(row, dict):
+            raise TypeError(f"a table's rows have to be dicts, not {type(row).__name__}")
+        for name in row:
+            if name not in data:
+                data[name] = [None] * count
+        for name, values in data.items():
+            values.append(row.get(name))
+        count += 1
+    return Table({name: column(values) for name, values in data.items()}, interpreter)
+
+def table(args, interpreter):
+    """table(data) makes a table out of a dict of columns (lists or arrays) or a list of dicts, one per row."""
+    data = args[0] if args else {}
+    if isinstance(data, Table):
+        return data
+    if isinstance(data, dict):
+        return Table({name: column(values) for name, values in data.items()}, interpreter)
+    return from_rows(data, interpreter)
+
+def table_csv(args, interpreter):
+    """table_csv(file, types={}, sep=",") reads a CSV file with a header into a table, see records.csv_read."""
+    types = args[1] if len(args) > 1 else None
+    sep = args[2] if len(args) > 2 else ','
+    return from_rows(csv_read([args[0], types, True, sep], interpreter), interpreter)
+
+def table_jsonl(args, interpreter):
+    """table_jsonl(file) reads a JSON Lines file of objects into a table."""
+    return from_rows(jsonl_read([args[0]], interpreter), interpreter)
@@ -0,0 +1,226 @@
+"""Runs numeric list comprehensions on whole arrays at once instead of one element at a time.
+
+A comprehension qualifies when it goes over numbers and its result and condition only do
+arithmetic and comparisons on the loop variable, numbers and other variables holding numbers.
+Everything else, and anything that could come out different in bulk (an int too big for 64 bits,
+a possible division by zero), runs the normal way.
+"""
+import sys, operator
+sys.dont_write_bytecode = True
+from collections import OrderedDict
+from numeric import numpy, Array, ARRAYS, scalar
+
+# Ints are only done in bulk while every value along the way provably stays below this
+LIMIT = 2 ** 53
+
+ARITHMETIC = {'+': operator.add, '-': operator.sub, '*': operator.mul, '/': operator.truediv, '%': operator.mod}
+COMPARISONS = {'==': operator.eq, '!=': operator.ne, '<': operator.lt, '>': operator.gt, '<=': operator.le, '>=': operator.ge}
+
+class NotVectorizable(Exception):
+    pass
+
+# How many comprehensions' plans are kept, the least recently used goes first. Each one keeps its
+# node (and so the tree it's in) alive, which in the serve daemon would otherwise be every tree ever parsed
+SIZE = 1024
+
+# id(node): (node, None if it qualifies or why it doesn't), least recently used first
+_plans = OrderedDict()
+
+def check(node):
+    """Why a listcomp node can't be done in bulk, or None if it can (as long as its values are numbers)."""
+    entry = _plans.get(id(node))
+    if entry is not None and entry[0] is node:
+        _plans.move_to_end(id(node))
+        return entry[1]
+    expr, var, iterable, step, condition = node[1:]
+    try:
+        pure(expr)
+        if condition is not None:
+            pure(condition)
+        reason = None
+    except NotVectorizable as e:
+        reason = str(e)
+    _plans[id(node)] = (node, reason)
+    _plans.move_to_end(id(node))
+    if len(_plans) > SIZE:
+        _plans.popitem(last=False)
+    return reason
+
+def unwrap(node):
+    # Some expressions come out of the parser wrapped in a tuple of their own, execute unwraps them the same way
+    while len(node) == 1 and isinstance(node[0], tuple):
+        node = node[0]
+    return node
+
+def pure(node):
+    node = unwrap(node)
+    kind = node[0]
+    if kind in ('num', 'var'):
+        return
+    if kind == 'binop' and node[1] in ARITHMETIC:
+        pure(node[2]), pure(node[3])
+    elif kind == 'compare' and node[1] in COMPARISONS:
+        pure(node[2]), pure(node[3])
+    elif kind in ('and', 'or'):
+        # Only the same as & and | when both sides are True or False
+        if not (boolean(node[1]) and boolean(node[2])):
+            raise NotVectorizable(f"'{kind}' between values that aren't True or False")
+        pure(node[1]), pure(node[2])
+    elif kind == 'not':
+        # ~ only means not on True and False, not of a number is left to the normal way
+        if not boolean(node[1]):
+            raise NotVectorizable("'not' of a value that isn't True or False")
+        pure(node[1])
+    else:
+        raise NotVectorizable(f"uses {kind}")
+
+def boolean(node):
+    return unwrap(node)[0] in ('compare', 'and', 'or', 'not')
+
+def run(interpreter, node, items, step, scope):
+    """The comprehension's result as a list, or None when it has to run element by element."""
+    report = interpreter.vector_report
+    reason = check(node)
+    if reason is None:
+        try:
+            result = evaluate(node, items, step, scope)
+        except NotVectorizable as e:
+            reason = str(e)
+    if report is not None:
+        report.note(node, reason)
+    return result if reason is None else None
+
+def evaluate(node, items, step, scope):
+    expr, var, iterable, _, condition = node[1:]
+    if not isinstance(step, int) or isinstance(step, bool) or step < 1:
+        raise NotVectorizable("the step isn't a positive int")
+    if isinstance(items, list):
+        items = items[::step] if step != 1 else items
+        kinds = set(map(type, items))
+        if kinds != {int} and kinds != {float}:
+            raise NotVectorizable("the items aren't all ints or all floats")
+        values = numpy.array(items) if numpy is not None else Array(items)
+    elif isinstance(items, ARRAYS):
+        values = items[::step] if step != 1 else items
+        kind = values.dtype.kind if numpy is not None else values.kind
+        if kind not in ('i', 'f', 'int', 'float'):
+            raise NotVectorizable("the array doesn't hold numbers")
+    else:
+        raise NotVectorizable(f"goes over a {type(items).__name__}")
+    if not len(values):
+        return []
+    lo, hi = scalar(values.min()), scalar(values.max())
+    env = {'var': var, 'values': values, 'bounds': (lo, hi), 'float': isinstance(lo, float), 'scope': scope}
+
+    result = bulk(expr, env)[0]
+    count = len(values)
+    if condition is not None:
+        mask = bulk(condition, env)[0]
+        if not boolean(condition):
+            mask = mask != 0
+        if not isinstance(mask, ARRAYS):
+            count = count if mask else 0
+        else:
+            count = int(mask.sum())
+            if isinstance(result, ARRAYS):
+                result = result[mask]
+    # The loop variable is left holding the last item, like it would be
+    scope[var] = scalar(values[-1])
+    if isinstance(result, ARRAYS):
+        return result.tolist() if count else []
+    return [result] * count
+
+def bulk(node, env):
+    """Evaluates node over every item at once, giving back (value, lowest, highest, is float)."""
+    node = unwrap(node)
+    kind = node[0]
+    if kind == 'num':
+        return node[1], node[1], node[1], isinstance(node[1], float)
+    if kind == 'var':
+        if node[1] == env['var']:
+            lo, hi = env['bounds']
+            return env['values'], lo, hi, env['float']
+        value = env['scope'].get(node[1])
+        if type(value) not in (int, float):
+            raise NotVectorizable(f"{node[1]} isn't a number")
+        return value, value, value, isinstance(value, float)
+    if kind == 'not':
+        value = bulk(node[1], env)[0]
+        return logical_not(value), 0, 1, False
+    if kind in ('and', 'or'):
+        a, b = bulk(node[1], env)[0], bulk(node[2], env)[0]
+        return logical(kind, a, b), 0, 1, False
+    a, alo, ahi, afloat = bulk(node[2], env)
+    b, blo, bhi, bfloat = bulk(node[3], env)
+    op = node[1]
+    if kind == 'compare':
+        return COMPARISONS[op](a, b), 0, 1, False
+    if op in ('/', '%') and blo <= 0 <= bhi:
+        raise NotVectorizable("might divide by zero")
+    if op == '%':
+        bounds = (0, bhi) if blo > 0 else (blo, 0)
+    else:
+        corners = [ARITHMETIC[op](x, y) for x in (alo, ahi) for y in (blo, bhi)]
+        bounds = (min(corners), max(corners))
+    is_float = afloat or bfloat or op == '/'
+    if not is_float and max(-bounds[0], bounds[1]) >= LIMIT:
+        raise NotVectorizable("the ints could get too big")
+    return ARITHMETIC[op](a, b), bounds[0], bounds[1], is_float
+
+def logical(kind, a, b):
+    if not isinstance(a, ARRAYS) and not isinstance(b, ARRAYS):
+        return (a and b) if kind == 'and' else (a or b)
+    if numpy is not None:
+        return numpy.logical_and(a, b) if kind == 'and' else numpy.logical_or(a, b)
+    return (a & b) if kind == 'and' else (a | b)
+
+def logical_not(value):
+    if not isinstance(value, ARRAYS):
+        return not value
+    return numpy.logical_not(value) if numpy is not None else ~value
+
+def render(node):
+    """Turns an expression back into roughly the code it came from, for the report."""
+    node = unwrap(node)
+    kind = node[0]
+    if kind in ('num', 'var'):
+        return str(node[1])
+    if kind in ('binop', 'compare'):
+        return f"({render(node[2])} {node[1]} {render(node[3])})"
+    if kind in ('and', 'or'):
+        return f"({render(node[1])} {kind} {render(node[2])})"
+    if kind == 'not':
+        return f"not {render(node[1])}"
+    if kind == 'call':
+        return f"{render(node[1])}(...)"
+    if kind == 'str':
+        return repr(node[1])
+    return f"<{kind}>"
+
+class Report:
+    """--vectorize-report: which comprehensions ran in bulk, and why the others didn't."""
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.seen = {}
+
+    def start(self):
+        self.interpreter.vector_report = self
+
+    def stop(self):
+        self.interpreter.vector_report = None
+
+    def note(self, node, reason):
+        entry = self.seen.setdefault(id(node), [node, 0, 0, reason])
+        entry[1 if reason is None else 2] += 1
+        if reason is not None:
+            entry[3] = reason
+
+    def report(self, out=sys.stderr):
+        print(f"nebula vectorize: {len(self.seen)} comprehension(s) big enough to try", file=out)
+        for node, done, fell_back, reason in self.seen.values():
+            expr, var, iterable, _, condition = node[1:]
+            text = f"[{render(expr)} | {var}, {render(iterable)}{' | ' + render(condition) if condition else ''}]"
+            if fell_back:
+                print(f"  element by element x{fell_back}: {text} ({reason})", file=out)
+            if done:
+                print(f"  vectorized x{done}: {text}", file=out)
@@ -0,0 +1,189 @@
+"""Slices of lists that share the list they came from instead of copying it.
+
+A slice of VIEW_MIN or more items gives back a ListView: the list underneath plus the range of
+positions the slice covers, so taking it costs the same whatever its length, and slicing a view
+again only works out a new range over the same list. Indexing, looping, length, `in`, == and
+printing read straight from the list underneath.
+
+A slice is still a copy as far as a script can tell. The interpreter calls changing(list) before
+anything changes a list in place, and every view of that list makes its own copy first. A view
+that's changed itself (append, index assignment, being handed to Python code) gets its own list
+the same way and is an ordinary list from then on.
+"""
+import sys, weakref
+sys.dont_write_bytecode = True
+
+# Slices shorter than this are copied, copying a few items is quicker than making a view of them
+VIEW_MIN = 256
+# Items copied at a time while looping over a view, see ListView.__iter__
+CHUNK = 256
+
+# id(list): {id(ref): ref} for the views of each list that has any
+_watched = {}
+
+class _Ref(weakref.ref):
+    # Knows which list its view is watching, so the entry goes once the view does
+    __slots__ = ('key',)
+
+def _forget(ref):
+    refs = _watched.get(ref.key)
+    if refs is not None:
+        refs.pop(id(ref), None)
+        if not refs:
+            del _watched[ref.key]
+
+def watch(base, view):
+    ref = _Ref(view, _forget)
+    ref.key = id(base)
+    refs = _watched.get(ref.key)
+    if refs is None:
+        refs = _watched[ref.key] = {}
+    refs[id(ref)] = ref
+
+def changing(base):
+    """Copies out every view of base before base changes in place, giving back base."""
+    if _watched:
+        refs = _watched.pop(id(base), None)
+        if refs is not None:
+            for ref in list(refs.values()):
+                view = ref()
+                if view is not None and view.base is base:
+                    view.materialize()
+    return base
+
+def as_slice(positions):
+    # The slice that gives the same items as a range of positions, stop can't be -1 going backwards
+    if not positions:
+        return slice(0, 0)
+    stop = positions.stop
+    if positions.step < 0 and stop < 0:
+        stop = None
+    return slice(positions.start, stop, positions.step)
+
+class ListView:
+    """The items of base at positions (a range), looked at in place until either of them changes."""
+    __slots__ = ('base', 'positions', 'private', '__weakref__')
+
+    def __init__(self, base, positions):
+        self.base = base
+        self.positions = positions
+        # Whether base is this view's own list, made by materialize(), which can then grow and shrink
+        self.private = False
+        watch(base, self)
+
+    def span(self):
+        """The positions in base the view covers right now."""
+        return range(len(self.base)) if self.private else self.positions
+
+    def tolist(self):
+        """A new list of the items, made by slicing the list underneath."""
+        return self.base[as_slice(self.span())]
+
+    def materialize(self):
+        # From here on base is a list only this view (and views taken of it later) has
+        if self.private:
+            return
+        self.base = self.tolist()
+        self.positions = None
+        self.private = True
+
+    def own(self):
+        """The view's own list, copying it out first if it's still sharing, for changing or handing to Python."""
+        self.materialize()
+        return changing(self.base)
+
+    def __len__(self):
+        return len(self.base) if self.private else len(self.positions)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return view(self, key)
+        if self.private:
+            return self.base[key]
+        try:
+            return self.base[self.positions[key]]
+        except IndexError:
+            raise IndexError("list index out of range") from None
+
+    def __setitem__(self, key, value):
+        self.own()[key] = value
+
+    def __iter__(self):
+        # A chunk at a time, copied, so the loop body changing the list underneath can't change what's looped over
+        for start in range(0, len(self), CHUNK):
+            yield from self.base[as_slice(self.span()[start:start + CHUNK])]
+
+    def __reversed__(self):
+        return iter(self[::-1])
+
+    def __contains__(self, item):
+        positions = self.span()
+        if positions.step == 1:
+            # A plain slice is searched by the list itself
+            try:
+                self.base.index(item, positions.start, positions.stop)
+                return True
+            except ValueError:
+                return False
+        base = self.base
+        return any(base[i] is item or base[i] == item for i in positions)
+
+    def index(self, item):
+        for i, value in enumerate(self):
+            if value is item or value == item:
+                return i
+        raise ValueError(f"{item!r} is not in list")
+
+    def count(self, item):
+        return sum(1 for value in self if value is item or value == item)
+
+    def __eq__(self, other):
+        if isinstance(other, ListView):
+            other = other.tolist()
+        if not isinstance(other, list):
+            return NotImplemented
+        return len(self) == len(other) and self.tolist() == other
+
+    __hash__ = None
+
+    def __add__(self, other):
+        return self.tolist() + (other.tolist() if isinstance(other, ListView) else other)
+
+    def __radd__(self, other):
+        return other + self.tolist()
+
+    def __mul__(self, times):
+        return self.tolist() * times
+
+    __rmul__ = __mul__
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __repr__(self):
+        return repr(self.tolist())
+
+    def __reduce__(self):
+        # Actors, pmap and diskdicts get an ordinary list, not the whole list underneath
+        return (list, (self.tolist(),))
+
+# What scripts see as a list
+LISTS = (list, ListView)
+
+def view(items, key):
+    """items[key] for a slice key: a ListView when it's long enough to be worth one, a copy when it isn't."""
+    if type(items) is ListView:
+        base, positions = items.base, items.span()[key]
+    else:
+        base, positions = items, range(len(items))[key]
+    if len(positions) < VIEW_MIN:
+        return base[as_slice(positions)]
+    return ListView(base, positions)
+
+def python_value(value):
+    """What a Python function gets for a nebula value: a view's own list (Python may change it), and lists with no views watching."""
+    if type(value) is ListView:
+        return value.own()
+    if type(value) is list:
+        changing(value)
+    return value